@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from shift_solver import solve_shift_model, read_staff_csv, read_requests_csv, check_input_columns, fill_missing_staff_names, build_params, export_excel, write_rosters_excel
+from horizon_solve import solve_horizon
+
+# 勤務表のバッチ作成（UIを使わずに、複数の月・部署をプロセスプールで並列に求解する）
+#
+# 使い方:
+#   python batch_solve.py --staff staff.csv --requests 'requests_{year}{month:02d}.csv' --params params.json --months 2025-04 2025-05 2025-06
+#
+# パラメータファイル(JSON)の例:
+#   {
+#     "year": 2025, "month": 4,
+#     "target_pt": 10, "target_ot": 5, "target_st": 3, "tolerance": 1,
+#     "s0_penalty": 200, "s6_on": true,
+#     "event_units": {"all": {"3": 20}, "pt": {}, "ot": {}, "st": {}},
+#     "jobs": [
+#       {"name": "病棟A", "staff_csv": "a_staff.csv", "requests_csv": "a_requests_202504.csv"},
+#       {"name": "病棟B", "staff_csv": "b_staff.csv", "requests_csv": "b_requests_202504.csv", "month": 5}
+#     ]
+#   }
+# "jobs" に書いた値は共通設定を上書きする。CSVの相対パスはパラメータファイルの場所を基準に解決する。
+# CSVのパスに {year} と {month:02d} を書くと、対象年月ごとのファイルを使う（例: "requests_{year}{month:02d}.csv"）。
+# 希望休一覧の列は日付（月なし）なので、--months で複数の月を指定するときは希望休一覧のパスに {month} を含める必要がある。
+#
+# --horizon を指定すると、部署ごとに対象年月を連続する複数月として順に解き、週の境目と日曜出勤の回数を次の月に引き継ぐ（horizon_solve.py）。
+#   python batch_solve.py --staff staff.csv --requests 'requests_{year}{month:02d}.csv' --months 2025-04 2025-05 2025-06 --horizon --horizon-budget 300
+#
+# --combined を指定すると、作成できた勤務表をすべて1つのブックにまとめて書き出す（月・部署ごとにシートを分ける）。
+
+def _parse_month(text):
+    year, month = text.split('-')
+    return int(year), int(month)
+
+def expand_jobs(base_params, staff_csv=None, requests_csv=None, months=None, base_dir='.'):
+    base_params = dict(base_params)
+    job_specs = base_params.pop('jobs', None) or [{}]
+    jobs = []
+    for spec in job_specs:
+        job = dict(base_params); job.update(spec)
+        job.setdefault('staff_csv', staff_csv); job.setdefault('requests_csv', requests_csv)
+        if job['staff_csv'] is None or job['requests_csv'] is None:
+            raise ValueError(f"職員一覧・希望休一覧のCSVが指定されていないジョブがあります: {spec.get('name', '(名前なし)')}")
+        for key in ['staff_csv', 'requests_csv']:
+            if not os.path.isabs(job[key]): job[key] = os.path.join(base_dir, job[key])
+        target_months = [_parse_month(m) for m in months] if months else [(job['year'], job['month'])]
+        for year, month in target_months:
+            jobs.append(dict(job, year=year, month=month, **{key: job[key].format(year=year, month=month) for key in ['staff_csv', 'requests_csv']}))
+    return jobs
+
+def _output_path(job, output_dir):
+    name = f"_{job['name']}" if job.get('name') else ''
+    return os.path.join(output_dir, f"schedule_{job['year']}{job['month']:02d}{name}.xlsx")
+
+def _load_job_params(job):
+    # ジョブの入力を読み込んで params を組み立てる。入力に不備があればエラーの一覧を返す
+    staff_df = read_staff_csv(job['staff_csv']); requests_df = read_requests_csv(job['requests_csv'])
+    input_errors = check_input_columns(staff_df, requests_df)
+    if input_errors: return None, input_errors
+    fill_missing_staff_names(staff_df)
+    overrides = {k: v for k, v in job.items() if k not in ['name', 'staff_csv', 'requests_csv', 'year', 'month', 'event_units']}
+    return build_params(staff_df, requests_df, job['year'], job['month'], job.get('event_units'), **overrides), []
+
+def run_job(job, output_dir):
+    started = time.perf_counter()
+    result = {'name': job.get('name'), 'year': job['year'], 'month': job['month'], 'output': None}
+    params, input_errors = _load_job_params(job)
+    if input_errors:
+        result.update(feasible=False, message=' / '.join(input_errors), elapsed=time.perf_counter() - started)
+        return result
+    is_feasible, schedule_df, summary_df, message, _ = solve_shift_model(params)
+    if is_feasible:
+        result['output'] = _output_path(job, output_dir)
+        export_excel(schedule_df, summary_df, result['output'])
+    result.update(feasible=is_feasible, message=message, elapsed=time.perf_counter() - started)
+    return result
+
+def run_horizon_job(jobs, output_dir, time_budget=None):
+    # 同じ部署の連続する月のジョブを、前月の状態を引き継ぎながら順に解く
+    started = time.perf_counter()
+    jobs = sorted(jobs, key=lambda job: (job['year'], job['month']))
+    results, month_params = [], []
+    for job in jobs:
+        params, input_errors = _load_job_params(job)
+        if input_errors:
+            return [{'name': job.get('name'), 'year': job['year'], 'month': job['month'], 'output': None, 'feasible': False,
+                     'message': ' / '.join(input_errors), 'elapsed': time.perf_counter() - started} for job in jobs]
+        month_params.append(params)
+    month_results = solve_horizon(month_params, time_budget)
+    for job, month_result in zip(jobs, month_results):
+        is_feasible, schedule_df, summary_df, message, _ = month_result['result']
+        result = {'name': job.get('name'), 'year': job['year'], 'month': job['month'], 'output': None, 'feasible': is_feasible, 'message': message,
+                  'elapsed': month_result['stats']['build_time'] + month_result['stats']['solve_time']}
+        if is_feasible:
+            result['output'] = _output_path(job, output_dir)
+            export_excel(schedule_df, summary_df, result['output'])
+        results.append(result)
+    for job in jobs[len(month_results):]:
+        results.append({'name': job.get('name'), 'year': job['year'], 'month': job['month'], 'output': None, 'feasible': False,
+                        'message': '前の月の勤務表が作成できなかったため、作成しませんでした。', 'elapsed': None})
+    return results
+
+def run_batch(jobs, output_dir, max_workers=None, on_result=None, horizon=False, horizon_budget=None):
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        if horizon:
+            # 部署（ジョブ名）ごとに月をまとめ、部署の間は並列、部署の中は月の順に解く
+            groups = {}
+            for job in jobs: groups.setdefault(job.get('name'), []).append(job)
+            futures = {executor.submit(run_horizon_job, group, output_dir, horizon_budget): group for group in groups.values()}
+        else:
+            futures = {executor.submit(run_job, job, output_dir): [job] for job in jobs}
+        for future in as_completed(futures):
+            try:
+                job_results = future.result()
+                if not horizon: job_results = [job_results]
+            except Exception as e:
+                job_results = [{'name': job.get('name'), 'year': job['year'], 'month': job['month'], 'output': None,
+                                'feasible': False, 'message': f'予期せぬエラーが発生しました: {e}', 'elapsed': None} for job in futures[future]]
+            for result in job_results:
+                results.append(result)
+                if on_result: on_result(result)
+    return sorted(results, key=lambda r: (r['year'], r['month'], r['name'] or ''))
+
+def _result_label(result):
+    return f"{result['year']}年{result['month']}月" + (f" {result['name']}" if result['name'] else '')
+
+def write_combined_excel(results, target):
+    # ジョブごとに書き出したファイルを1件ずつ読み直して追記するため、全部の勤務表を同時にメモリに持たない
+    rosters = ((_result_label(r), pd.read_excel(r['output'], sheet_name='勤務表', dtype={'職員番号': str}, keep_default_na=False),
+                pd.read_excel(r['output'], sheet_name='日別サマリー')) for r in results if r['output'])
+    write_rosters_excel(target, rosters)
+
+def _print_result(result):
+    label = _result_label(result)
+    elapsed = f"{result['elapsed']:.1f}s" if result['elapsed'] is not None else '-'
+    print(f"[{'OK' if result['feasible'] else 'NG'}] {label} ({elapsed}) {result['message']}" + (f" -> {result['output']}" if result['output'] else ''), flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='勤務表をバッチ作成します（UIなし）。')
+    parser.add_argument('--staff', help='職員一覧CSV（ジョブごとに指定しない場合の既定値）')
+    parser.add_argument('--requests', help='希望休一覧CSV（ジョブごとに指定しない場合の既定値）')
+    parser.add_argument('--params', help='パラメータファイル(JSON)')
+    parser.add_argument('--months', nargs='*', help='対象年月 (例: 2025-04 2025-05)。指定するとパラメータファイルの year/month より優先')
+    parser.add_argument('--output-dir', default='output', help='Excelの出力先ディレクトリ')
+    parser.add_argument('--workers', type=int, default=None, help='同時に実行する求解プロセス数（既定: CPUコア数）')
+    parser.add_argument('--solver-workers', type=int, default=None, help='1回の求解で使う探索スレッド数（既定: CPUコア数をプロセス数で割った値）')
+    parser.add_argument('--time-limit', type=float, default=None, help='1回の求解の制限時間（秒）')
+    parser.add_argument('--horizon', action='store_true', help='部署ごとに対象年月を連続する複数月として順に解き、週の境目と日曜出勤の回数を引き継ぐ')
+    parser.add_argument('--horizon-budget', type=float, default=None, help='--horizon で1部署の全期間に使う制限時間（秒）。残りの月数で均等に割り振る')
+    parser.add_argument('--combined', help='作成できた勤務表をすべてまとめて書き出すExcelファイル')
+    args = parser.parse_args(argv)
+
+    base_params, base_dir = {}, '.'
+    if args.params:
+        with open(args.params, encoding='utf-8') as f: base_params = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(args.params))
+    if not args.months and ('year' not in base_params or 'month' not in base_params) and not all('year' in j and 'month' in j for j in base_params.get('jobs', [{}])):
+        parser.error('対象年月を --months かパラメータファイルの year/month で指定してください。')
+    if args.months and len(set(args.months)) > 1:
+        # 同じ希望休一覧を複数の月に使うと、ある月の希望休が他の月にもそのまま当てはめられてしまう
+        request_paths = [spec.get('requests_csv', base_params.get('requests_csv')) or args.requests for spec in base_params.get('jobs') or [{}]]
+        if not all(path and '{month' in path for path in request_paths):
+            parser.error('複数の月を作成するときは、希望休一覧のパスに {month:02d} などを含めて月ごとのファイルを指定してください。')
+    staff_csv = os.path.abspath(args.staff) if args.staff else None
+    requests_csv = os.path.abspath(args.requests) if args.requests else None
+    jobs = expand_jobs(base_params, staff_csv, requests_csv, args.months, base_dir)
+    # 複数プロセスで同時に解くため、探索スレッド数はコア数を分け合う
+    num_parallel = len({job.get('name') for job in jobs}) if args.horizon else len(jobs)
+    solver_workers = args.solver_workers or max(1, (os.cpu_count() or 1) // min(args.workers or os.cpu_count() or 1, num_parallel or 1))
+    for job in jobs:
+        job.setdefault('num_workers', solver_workers)
+        if args.time_limit is not None: job['time_limit'] = args.time_limit
+    results = run_batch(jobs, args.output_dir, args.workers, on_result=_print_result, horizon=args.horizon, horizon_budget=args.horizon_budget)
+    if args.combined:
+        write_combined_excel(results, args.combined)
+        print(f"{sum(1 for r in results if r['output'])}件の勤務表をまとめました -> {args.combined}", flush=True)
+    return 0 if all(r['feasible'] for r in results) else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,156 @@
+import argparse
+import calendar
+import json
+import os
+import platform
+import random
+import time
+from datetime import datetime
+
+import pandas as pd
+from ortools import __version__ as ORTOOLS_VERSION
+
+from shift_solver import build_params, solve_shift_model
+
+# 勤務表モデルのベンチマーク
+#
+# 使い方:
+#   python benchmark.py [--sizes 20 50 100 200 400] [--month 2025-04] [--time-limit 60] [--output bench_result.json]
+#   python benchmark.py --symmetry compare --density 0.03   # 対称性の除去あり・なしを同じ入力で比較する
+#
+# 実際の職員構成に近い合成データ（職員一覧・希望休一覧）を職員数ごとに生成し、solve_shift_model を実行して
+# モデル構築時間・求解時間・目的関数値・下界・ステータスを記録する。結果は JSON（拡張子が .csv なら CSV）で書き出す。
+
+DEFAULT_SIZES = [20, 50, 100, 200, 400]
+JOB_MIX = [('理学療法士', 0.55), ('作業療法士', 0.30), ('言語聴覚士', 0.15)]
+ROLE_MIX = [(None, 0.50), ('回復期専従', 0.32), ('地域包括専従', 0.10), ('外来PT', 0.08)]
+UNITS_PER_DAY = [18, 19, 20, 21, 22, 24]
+# 希望休の種類ごとの出現比率（AM休/PM休は H1 の偶奇が崩れないよう2つ1組で入れる）
+REQUEST_MIX = [('×', 0.30), ('△', 0.20), ('○', 0.05), ('有', 0.20), ('特', 0.03), ('夏', 0.05),
+               ('AM有', 0.04), ('PM有', 0.04), ('AM休', 0.045), ('PM休', 0.045)]
+MAX_OFF_REQUESTS = 4
+
+def _weighted_choice(rng, items):
+    values, weights = zip(*items)
+    return rng.choices(values, weights=weights)[0]
+
+def generate_staff_df(num_staff, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(num_staff):
+        job = _weighted_choice(rng, JOB_MIX)
+        role = _weighted_choice(rng, ROLE_MIX)
+        if role == '外来PT': job = '理学療法士'
+        rows.append({'職員番号': f'{i + 1:04d}', '職員名': f'職員{i + 1:04d}', '職種': job, '役職': None, '役割1': role,
+                     '1日の単位数': rng.choice(UNITS_PER_DAY)})
+    # 役職者は日曜出勤できる職員から選ぶ（H3 を満たせる人数を確保する）
+    candidates = [row for row in rows if row['役割1'] not in ('外来PT', '地域包括専従')]
+    for row in rng.sample(candidates, min(len(candidates), max(3, round(num_staff * 0.08)))):
+        row['役職'] = rng.choice(['科長', '主任'])
+    return pd.DataFrame(rows)
+
+def generate_requests_df(staff_df, year, month, density=0.1, seed=0):
+    rng = random.Random(seed)
+    num_days = calendar.monthrange(year, month)[1]
+    sundays = {d for d in range(1, num_days + 1) if calendar.weekday(year, month, d) == 6}
+    rows = []
+    for staff_id in staff_df['職員番号']:
+        row = {'職員番号': staff_id}
+        num_off = 0; half_kokyu_days = []
+        for d in range(1, num_days + 1):
+            if rng.random() >= density: continue
+            request = _weighted_choice(rng, REQUEST_MIX)
+            if d in sundays and request in ('○', 'AM有', 'PM有', 'AM休', 'PM休'): continue
+            if request in ('×', '△'):
+                if num_off >= MAX_OFF_REQUESTS: continue
+                num_off += 1
+            if request in ('AM休', 'PM休'):
+                half_kokyu_days.append(d); continue
+            row[str(d)] = request
+        for d in half_kokyu_days[:len(half_kokyu_days) // 2 * 2][:2]:
+            row[str(d)] = rng.choice(['AM休', 'PM休'])
+        rows.append(row)
+    return pd.DataFrame(rows, columns=['職員番号'] + [str(d) for d in range(1, num_days + 1)])
+
+def generate_params(num_staff, year, month, density=0.1, seed=0, **overrides):
+    staff_df = generate_staff_df(num_staff, seed)
+    requests_df = generate_requests_df(staff_df, year, month, density, seed)
+    rng = random.Random(seed)
+    num_days = calendar.monthrange(year, month)[1]
+    weekdays = [d for d in range(1, num_days + 1) if calendar.weekday(year, month, d) != 6]
+    event_units = {key: {d: rng.choice([10, 20, 30]) * max(1, num_staff // 50) for d in rng.sample(weekdays, 3)} for key in ['all', 'pt', 'ot', 'st']}
+    # 日曜の目標人数は職員数に比例させる（各職員の日曜出勤は月2回まで）
+    num_sundays = num_days - len(weekdays)
+    job_counts = staff_df['職種'].value_counts()
+    targets = {f'target_{key}': max(1, round(job_counts.get(job, 0) * 1.5 / num_sundays))
+               for key, job in [('pt', '理学療法士'), ('ot', '作業療法士'), ('st', '言語聴覚士')]}
+    targets.update(overrides)
+    return build_params(staff_df, requests_df, year, month, event_units, **targets)
+
+def run_benchmark(sizes, year, month, density=0.1, seed=0, on_result=None, **overrides):
+    results = []
+    for num_staff in sizes:
+        params = generate_params(num_staff, year, month, density, seed, **overrides)
+        started = time.perf_counter()
+        is_feasible = solve_shift_model(params)[0]
+        row = {'num_staff': num_staff, 'year': year, 'month': month, 'density': density, 'seed': seed, 'feasible': is_feasible,
+               'symmetry_breaking': bool(params.get('symmetry_breaking')), 'interchangeable_staff': sum(len(members) for members in params.get('symmetry_classes', []))}
+        row.update(params['solve_stats'])
+        row['total_time'] = time.perf_counter() - started
+        if row['objective'] is not None and row['objective'] > 0:
+            row['gap'] = (row['objective'] - row['best_bound']) / row['objective']
+        else:
+            row['gap'] = 0.0 if row['objective'] is not None else None
+        results.append(row)
+        if on_result: on_result(row)
+    return results
+
+def write_results(results, path, settings):
+    if path.endswith('.csv'):
+        pd.DataFrame(results).assign(**{key: str(value) for key, value in settings.items()}).to_csv(path, index=False)
+        return
+    report = {'created_at': datetime.now().isoformat(timespec='seconds'), 'ortools': ORTOOLS_VERSION,
+              'python': platform.python_version(), 'cpu_count': os.cpu_count(), 'settings': settings, 'results': results}
+    with open(path, 'w', encoding='utf-8') as f: json.dump(report, f, ensure_ascii=False, indent=2)
+
+def write_inputs(sizes, year, month, density, seed, directory):
+    os.makedirs(directory, exist_ok=True)
+    for num_staff in sizes:
+        params = generate_params(num_staff, year, month, density, seed)
+        params['staff_df'].to_csv(os.path.join(directory, f'staff_{num_staff}.csv'), index=False)
+        params['requests_df'].to_csv(os.path.join(directory, f'requests_{num_staff}_{year}{month:02d}.csv'), index=False)
+
+def _print_result(row):
+    objective = f"{row['objective']:.0f}" if row['objective'] is not None else '-'
+    bound = f"{row['best_bound']:.0f}" if row['best_bound'] is not None else '-'
+    print(f"職員 {row['num_staff']:>4}名  対称性除去 {'あり' if row['symmetry_breaking'] else 'なし'}（{row['interchangeable_staff']:>3}名）  変数 {row['variables']:>7}  制約 {row['constraints']:>7}  構築 {row['build_time']:.2f}s  "
+          f"求解 {row['solve_time']:.2f}s  {row['status']:<10} 目的関数 {objective:>8}  下界 {bound:>8}", flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='合成データで勤務表モデルの性能を計測します。')
+    parser.add_argument('--sizes', type=int, nargs='*', default=DEFAULT_SIZES, help='職員数の一覧')
+    parser.add_argument('--month', default='2025-04', help='対象年月 (例: 2025-04)')
+    parser.add_argument('--density', type=float, default=0.1, help='職員×日あたりの希望休の出現率')
+    parser.add_argument('--seed', type=int, default=0, help='合成データの乱数シード')
+    parser.add_argument('--time-limit', type=float, default=60.0, help='1回の求解の制限時間（秒）')
+    parser.add_argument('--num-workers', type=int, default=None, help='探索スレッド数（既定: CPUコア数）')
+    parser.add_argument('--s6-encoding', choices=['compact', 'legacy'], default='compact', help='S6の定式化')
+    parser.add_argument('--symmetry', choices=['on', 'off', 'compare'], default='off', help='入れ替え可能な職員の対称性の除去（compare は両方を計測）')
+    parser.add_argument('--output', default='bench_result.json', help='結果の出力先 (.json または .csv)')
+    parser.add_argument('--write-inputs', metavar='DIR', help='計測せずに、合成した職員一覧・希望休一覧のCSVをこのディレクトリに書き出す')
+    args = parser.parse_args(argv)
+
+    year, month = (int(x) for x in args.month.split('-'))
+    if args.write_inputs:
+        write_inputs(args.sizes, year, month, args.density, args.seed, args.write_inputs)
+        return 0
+    settings = {'time_limit': args.time_limit, 'num_workers': args.num_workers, 's6_encoding': args.s6_encoding}
+    results = []
+    for symmetry_breaking in {'on': [True], 'off': [False], 'compare': [False, True]}[args.symmetry]:
+        results += run_benchmark(args.sizes, year, month, args.density, args.seed, on_result=_print_result, symmetry_breaking=symmetry_breaking, **settings)
+    settings['symmetry'] = args.symmetry
+    write_results(results, args.output, settings)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,75 @@
+import calendar
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from shift_solver import solve_shift_model
+
+# 複数月（四半期・半期など）の勤務表の作成
+# 月ごとのモデルを順に解くローリング方式で、前月の解から次の状態を引き継ぐ。
+#   - 週の境目: 前月末の週（土曜で終わらない週）の日数・休日の値・終日の希望数。月初の週と合わせて7日になれば S0 の週として扱う
+#   - 日曜出勤: 前月末の日曜出勤の履歴。月をまたぐ連続 window 回の日曜でも出勤を2回までにする（H5）
+#   - 初期解: 前月の同じ曜日（4週前、月末は5週前）の勤務をヒントにする
+# 全体の制限時間（time_budget）は残りの月数で均等に割り、早く解けた月の余りは後の月に回す。
+
+HORIZON_WINDOW_SUNDAYS = 4
+
+def carry_over_state(params, shift_matrix, carry_in=None, window_sundays=HORIZON_WINDOW_SUNDAYS):
+    # 解いた月の末尾から、次の月に引き継ぐ状態を作る（shift_matrix は 職員 × 日 の出勤(1)/休み(0) 行列）
+    year, month = params['year'], params['month']
+    num_days = calendar.monthrange(year, month)[1]; days = list(range(1, num_days + 1))
+    requests = params['request_arrays']
+    last_saturday = max(d for d in days if calendar.weekday(year, month, d) == 5)
+    tail = [d - 1 for d in days if d > last_saturday]
+    sundays = [d - 1 for d in days if calendar.weekday(year, month, d) == 6]
+    work = shift_matrix[:, tail].astype(np.int64)
+    holiday_values = (2 * (1 - work) + work * requests.half_mask[:, tail]).sum(axis=1)
+    full_requests = requests.full_off_mask[:, tail].sum(axis=1)
+    history = (carry_in or {}).get('sundays_worked', {})
+    state = {'week_days': len(tail), 'week_holiday_value': {}, 'week_full_requests': {}, 'sundays_worked': {}}
+    for s_idx, s in enumerate(params['staff']):
+        state['week_holiday_value'][s] = int(holiday_values[s_idx])
+        state['week_full_requests'][s] = int(full_requests[s_idx])
+        state['sundays_worked'][s] = (list(history.get(s, [])) + shift_matrix[s_idx, sundays].tolist())[-(window_sundays - 1):]
+    return state
+
+def shifted_hint(previous_params, year, month):
+    # 前月の同じ曜日の勤務を、次の月の初期解のヒントにする（4週前、それが前月にない日は5週前）
+    num_days = calendar.monthrange(year, month)[1]
+    previous_matrix = previous_params['shift_matrix']
+    hints = {}
+    for d in range(1, num_days + 1):
+        current = date(year, month, d)
+        for weeks in (4, 5):
+            source = current - timedelta(weeks=weeks)
+            if (source.year, source.month) == (previous_params['year'], previous_params['month']): break
+        else:
+            continue
+        for s_idx, s in enumerate(previous_params['staff']): hints[(s, d)] = int(previous_matrix[s_idx, source.day - 1])
+    return hints
+
+def solve_horizon(month_params, time_budget=None, window_sundays=HORIZON_WINDOW_SUNDAYS, on_month=None):
+    # month_params は連続する月の params（build_params の戻り値）の一覧。月ごとの結果を順に返す
+    started = time.perf_counter()
+    results = []
+    carry_in, previous = None, None
+    for i, params in enumerate(month_params):
+        if previous is not None and (params['year'], params['month']) != _next_month(previous['year'], previous['month']):
+            raise ValueError(f"{previous['year']}年{previous['month']}月の次の月は {params['year']}年{params['month']}月ではありません。連続する月を指定してください。")
+        if time_budget is not None:
+            params['time_limit'] = max(1.0, (time_budget - (time.perf_counter() - started)) / (len(month_params) - i))
+        params['h5_window_sundays'] = window_sundays
+        if carry_in is not None:
+            params['carry_in'] = carry_in
+            if not params.get('hint_values'): params['hint_values'] = shifted_hint(previous, params['year'], params['month'])
+        result = solve_shift_model(params)
+        results.append({'year': params['year'], 'month': params['month'], 'result': result, 'stats': params.get('solve_stats')})
+        if on_month: on_month(results[-1])
+        if not result[0]: break  # 解けなかった月から先は、引き継ぐ状態がないため作成しない
+        carry_in = carry_over_state(params, params['shift_matrix'], carry_in, window_sundays)
+        previous = params
+    return results
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
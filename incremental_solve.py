@@ -0,0 +1,119 @@
+import argparse
+import calendar
+import json
+
+import pandas as pd
+
+from shift_solver import WORK_SYMBOLS, REQUEST_TYPES, read_staff_csv, read_requests_csv, fill_missing_staff_names, build_params, solve_shift_model, export_excel
+
+# 公開済みの勤務表を保ったままの再作成
+#
+# 使い方:
+#   python incremental_solve.py --staff staff.csv --requests requests.csv --month 2025-04 --previous schedule_202504.xlsx \
+#       --change 0012:15:有 --change 0031:20: [--mode neighbourhood|min_change] [--radius 3] [--output schedule_new.xlsx]
+#
+# 急な欠勤や追加の有休などで希望が変わったとき、前回の勤務表（schedule_df）と変更された希望の一覧から勤務表を作り直す。
+#   neighbourhood: 変更のあった職員の全日と、変更日の前後 radius 日の全職員だけを解き直し、それ以外のセルは前回の値に固定する
+#   min_change:    全セルを解き直すが、前回の勤務表から変えたセルごとにペナルティ（change_penalty）を課す
+# neighbourhood で解が見つからない場合は min_change で解き直す。どちらのモードでも、解き直すセルは前回から変えないほど良いとする。
+
+INCREMENTAL_MODES = ['neighbourhood', 'min_change']
+
+def schedule_values(schedule_df, days):
+    # 勤務表の記号から 出勤(1) / 休み(0) を読み取る
+    schedule_df = schedule_df.rename(columns=lambda col: int(col) if str(col).isdigit() else col)
+    work = schedule_df[days].isin(WORK_SYMBOLS).to_numpy()
+    staff = schedule_df['職員番号'].astype(str).tolist()
+    return {(s, d): int(work[i, j]) for i, s in enumerate(staff) for j, d in enumerate(days)}
+
+def apply_request_changes(requests_df, changes):
+    # changes は (職員番号, 日, 新しい希望) の一覧。希望を取り消す場合は None か空文字を指定する
+    requests_df = requests_df.copy()
+    for staff_id, day, request in changes:
+        column = str(day)
+        if column not in requests_df.columns: requests_df[column] = None
+        # 誰も希望を出していない日の列は float64（全て NaN）として読まれるため、記号を入れる前に object にする
+        requests_df[column] = requests_df[column].astype(object)
+        if request and request not in REQUEST_TYPES: raise ValueError(f"職員番号 {staff_id} の {day}日の希望「{request}」は不明な種類です。")
+        rows = requests_df['職員番号'] == staff_id
+        if not rows.any():
+            requests_df = pd.concat([requests_df, pd.DataFrame([{'職員番号': staff_id}])], ignore_index=True)
+            rows = requests_df['職員番号'] == staff_id
+        requests_df.loc[rows, column] = request or None
+    return requests_df
+
+def neighbourhood_cells(staff, days, changes, radius):
+    # 変更のあった職員の全日と、変更日の前後 radius 日の全職員を解き直す対象にする
+    changed_staff = {staff_id for staff_id, _, _ in changes}
+    changed_days = {int(day) for _, day, _ in changes}
+    near_days = {d for d in days if any(abs(d - day) <= radius for day in changed_days)}
+    return {(s, d) for s in staff for d in days if s in changed_staff or d in near_days}
+
+def resolve_incremental(params, previous_schedule_df, changes, mode='neighbourhood', radius=3):
+    if mode not in INCREMENTAL_MODES: raise ValueError(f"mode は {INCREMENTAL_MODES} のいずれかを指定してください。")
+    num_days = calendar.monthrange(params['year'], params['month'])[1]; days = list(range(1, num_days + 1))
+    staff = params['staff_df']['職員番号'].tolist()
+    previous = schedule_values(previous_schedule_df, days)
+    # 前回の勤務表にいない職員（途中から追加された職員など）は、固定も変更ペナルティも付けない
+    staff_set = set(staff)
+    previous = {(s, d): value for (s, d), value in previous.items() if s in staff_set}
+    base_params = dict(params, requests_df=apply_request_changes(params['requests_df'], changes), hint_values=previous, reference_values=previous)
+
+    result = None
+    if mode == 'neighbourhood':
+        free_cells = neighbourhood_cells(staff, days, changes, radius)
+        # 固定を外して調べる矛盾の診断はここでは何も見つけないので省き、解けなければすぐ min_change に移る
+        local_params = dict(base_params, fixed_values={cell: value for cell, value in previous.items() if cell not in free_cells}, diagnose_infeasible=False)
+        result = solve_shift_model(local_params)
+        if result[0]: solved_params = local_params
+    if result is None or not result[0]:
+        solved_params = dict(base_params)
+        result = solve_shift_model(solved_params)
+        if mode == 'neighbourhood' and result[0]:
+            result = result[:3] + (f"{result[3]}（近傍だけでは解が見つからなかったため、全体を解き直しました）",) + result[4:]
+    params.update({key: value for key, value in solved_params.items() if key != 'diagnose_infeasible'})
+
+    is_feasible, schedule_df, summary_df, message, all_half_day_requests = result
+    if is_feasible:
+        changed_cells = [cell for cell, value in previous.items() if params['shifts_values'].get(cell, value) != value]
+        params['changed_cells'] = changed_cells
+        message = f"{message}（前回の勤務表から {len(changed_cells)} セルを変更）"
+    return is_feasible, schedule_df, summary_df, message, all_half_day_requests
+
+def _parse_change(value):
+    staff_id, day, request = value.split(':', 2)
+    return staff_id, int(day), request or None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='前回の勤務表を保ったまま、変更された希望を反映して勤務表を作り直します。')
+    parser.add_argument('--staff', required=True, help='職員一覧CSV')
+    parser.add_argument('--requests', required=True, help='希望休一覧CSV（変更前）')
+    parser.add_argument('--month', required=True, help='対象年月 (例: 2025-04)')
+    parser.add_argument('--previous', required=True, help='前回の勤務表 (Excel の「勤務表」シート、または CSV)')
+    parser.add_argument('--change', action='append', type=_parse_change, default=[], metavar='職員番号:日:希望', help='変更された希望（取り消しは希望を空にする）。複数指定可')
+    parser.add_argument('--params', help='パラメータファイル(JSON)')
+    parser.add_argument('--mode', choices=INCREMENTAL_MODES, default='neighbourhood', help='再作成の方法')
+    parser.add_argument('--radius', type=int, default=3, help='neighbourhood で解き直す、変更日の前後の日数')
+    parser.add_argument('--time-limit', type=float, default=None, help='制限時間（秒）')
+    parser.add_argument('--output', help='作り直した勤務表の出力先 (.xlsx)')
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    if args.params:
+        with open(args.params, encoding='utf-8') as f: overrides = json.load(f)
+    if args.time_limit is not None: overrides['time_limit'] = args.time_limit
+    year, month = (int(x) for x in args.month.split('-'))
+    staff_df = read_staff_csv(args.staff); requests_df = read_requests_csv(args.requests)
+    fill_missing_staff_names(staff_df)
+    event_units = overrides.pop('event_units', None)
+    params = build_params(staff_df, requests_df, year, month, event_units, **overrides)
+    if args.previous.endswith('.csv'): previous_df = pd.read_csv(args.previous, dtype={'職員番号': str}, keep_default_na=False)
+    else: previous_df = pd.read_excel(args.previous, sheet_name='勤務表', dtype={'職員番号': str}, keep_default_na=False)
+
+    is_feasible, schedule_df, summary_df, message, _ = resolve_incremental(params, previous_df, args.change, args.mode, args.radius)
+    print(message)
+    if is_feasible and args.output: export_excel(schedule_df, summary_df, args.output)
+    return 0 if is_feasible else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,183 @@
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from shift_solver import solve_shift_model
+from incremental_solve import resolve_incremental
+from penalty_sweep import solve_sweep_scenario
+
+# 求解ジョブのキュー
+# 「勤務表を作成」・希望の変更を反映した再作成・ペナルティ重みのスイープを、同時実行数を制限したプロセスプールで実行する。
+# ジョブの状態と結果はジョブごとのディレクトリに保存するため、画面の再実行やページの再読み込みをまたいで参照できる。
+#
+#   jobs/<job_id>/status.json  状態（queued / running / done / failed）と途中経過
+#   jobs/<job_id>/result.json  求解結果（勤務表・サマリー・レポートなど）
+#   jobs/<job_id>/stop         このファイルがあれば、その時点の最良解で探索を打ち切る
+
+JOB_STATUSES_FINISHED = ('done', 'failed')
+# ジョブの種類。solve は solve_shift_model(params)、incremental は resolve_incremental(params, **task_args)、
+# sweep_scenario はコンパイル済みのモデルでペナルティ重みのスイープの1シナリオを解く（solve_sweep_scenario(**task_args)）
+JOB_TASKS = ('solve', 'incremental', 'sweep_scenario')
+# ジョブIDは URL（?job=）からも渡されるため、この形式以外はパスとして扱わない
+_JOB_ID_PATTERN = re.compile(r'[0-9a-f]{12}')
+# 求解パラメータのうち、プロセスをまたいで渡せない（渡す必要のない）もの
+_LOCAL_ONLY_KEYS = ('on_progress', 'stop_event')
+
+def _write_json(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(data, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+
+def _read_json(path):
+    with open(path, encoding='utf-8') as f: return json.load(f)
+
+def _frame_to_json(df):
+    data = df.to_dict('split')
+    return {'columns': data['columns'], 'dtypes': [str(dtype) for dtype in df.dtypes], 'data': data['data']}
+
+def _frame_from_json(data):
+    return pd.DataFrame(data['data'], columns=data['columns']).astype(dict(zip(data['columns'], data['dtypes'])))
+
+def _result_to_json(result, params):
+    is_feasible, schedule_df, summary_df, message, all_half_day_requests = result
+    shifts_values, changed_cells = params.get('shifts_values'), params.get('changed_cells')
+    return {
+        'is_feasible': is_feasible, 'schedule': _frame_to_json(schedule_df), 'summary': _frame_to_json(summary_df), 'message': message,
+        'half_day_requests': {s: sorted(days) for s, days in all_half_day_requests.items()} if all_half_day_requests is not None else None,
+        'shifts_values': [[s, d, v] for (s, d), v in shifts_values.items()] if shifts_values is not None else None,
+        'changed_cells': [list(cell) for cell in changed_cells] if changed_cells is not None else None,
+        'report': params.get('solve_report'),
+    }
+
+def _result_from_json(data):
+    if 'sweep_row' in data: return data
+    half_day_requests = {s: set(days) for s, days in data['half_day_requests'].items()} if data['half_day_requests'] is not None else None
+    result = (data['is_feasible'], _frame_from_json(data['schedule']), _frame_from_json(data['summary']), data['message'], half_day_requests)
+    shifts_values = {(s, d): v for s, d, v in data['shifts_values']} if data['shifts_values'] is not None else None
+    changed_cells = [tuple(cell) for cell in data['changed_cells']] if data['changed_cells'] is not None else None
+    return {'result': result, 'shifts_values': shifts_values, 'changed_cells': changed_cells, 'report': data['report']}
+
+def _watch_stop_file(stop_path, stop_event, finished):
+    while not finished.is_set():
+        if os.path.exists(stop_path):
+            stop_event.set(); return
+        finished.wait(0.5)
+
+def _run_solve_job(job_dir, params, task='solve', task_args=None):
+    status_path = os.path.join(job_dir, 'status.json')
+    status = _read_json(status_path)
+    status.update(status='running', started_at=time.time())
+    _write_json(status_path, status)
+
+    def on_progress(info):
+        status['progress'].append(info)
+        _write_json(status_path, status)
+
+    stop_event, finished = threading.Event(), threading.Event()
+    threading.Thread(target=_watch_stop_file, args=(os.path.join(job_dir, 'stop'), stop_event, finished), daemon=True).start()
+    params = dict(params, on_progress=on_progress, stop_event=stop_event)
+    try:
+        if task == 'sweep_scenario':
+            solver_params = dict(task_args['solver_params'], num_workers=params['num_workers'])
+            row = solve_sweep_scenario(task_args['compiled'], task_args['scenario_id'], task_args['weights'], solver_params)
+            _write_json(os.path.join(job_dir, 'result.json'), {'sweep_row': row})
+            status.update(status='done', message=row['status'])
+        else:
+            result = resolve_incremental(params, **task_args) if task == 'incremental' else solve_shift_model(params)
+            _write_json(os.path.join(job_dir, 'result.json'), _result_to_json(result, params))
+            status.update(status='done', message=result[3])
+    except Exception as e:
+        status.update(status='failed', message=f'予期せぬエラーが発生しました: {e}')
+    finally:
+        finished.set()
+    status['finished_at'] = time.time()
+    _write_json(status_path, status)
+    return status['status']
+
+class SolveJobQueue:
+    def __init__(self, job_root='jobs', max_concurrent=2, keep_hours=48):
+        self.job_root = job_root
+        self.max_concurrent = max_concurrent
+        os.makedirs(job_root, exist_ok=True)
+        self._executor = ProcessPoolExecutor(max_workers=max_concurrent, mp_context=multiprocessing.get_context('spawn'))
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.purge(keep_hours)
+
+    def _job_dir(self, job_id):
+        # 形式に合わないID（パス区切りや .. を含むものなど）は None を返し、ジョブが存在しないものとして扱う
+        if not isinstance(job_id, str) or not _JOB_ID_PATTERN.fullmatch(job_id): return None
+        return os.path.join(self.job_root, job_id)
+
+    def submit(self, params, label='', task='solve', task_args=None):
+        if task not in JOB_TASKS: raise ValueError(f"task は {JOB_TASKS} のいずれかを指定してください。")
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir)
+        # 同時に複数のジョブが動くため、探索スレッド数はコア数を分け合う
+        params = {k: v for k, v in params.items() if k not in _LOCAL_ONLY_KEYS}
+        # 画面の「探索スレッド数」は既定でCPUコア数なので、指定があっても1ジョブの取り分（コア数 ÷ 同時実行数）を上限にする
+        share = max(1, (os.cpu_count() or 1) // self.max_concurrent)
+        params['num_workers'] = min(int(params.get('num_workers') or share), share)
+        _write_json(os.path.join(job_dir, 'status.json'), {
+            'job_id': job_id, 'label': label, 'task': task, 'status': 'queued', 'year': params['year'], 'month': params['month'],
+            'submitted_at': time.time(), 'started_at': None, 'finished_at': None, 'message': '', 'progress': [],
+        })
+        with self._lock:
+            self._futures[job_id] = self._executor.submit(_run_solve_job, job_dir, params, task, task_args or {})
+        return job_id
+
+    def status(self, job_id):
+        job_dir = self._job_dir(job_id)
+        if job_dir is None: return None
+        status_path = os.path.join(job_dir, 'status.json')
+        if not os.path.exists(status_path): return None
+        status = _read_json(status_path)
+        with self._lock: future = self._futures.get(job_id)
+        if status['status'] not in JOB_STATUSES_FINISHED:
+            if future is None:
+                # アプリの再起動などで実行中のプロセスが失われたジョブ
+                status.update(status='failed', message='ジョブの実行が中断されました。もう一度作成してください。')
+            elif future.done() and future.exception() is not None:
+                status.update(status='failed', message=f'予期せぬエラーが発生しました: {future.exception()}')
+            elif status['status'] == 'queued':
+                status['queue_position'] = self._queue_position(job_id, status['submitted_at'])
+        return status
+
+    def _queue_position(self, job_id, submitted_at):
+        # 自分より先に投入され、まだ開始していないジョブの数（0 なら次に実行される）
+        position = 0
+        with self._lock: pending = [other for other, future in self._futures.items() if other != job_id and not future.done()]
+        for other in pending:
+            other_status = _read_json(os.path.join(self._job_dir(other), 'status.json'))
+            if other_status['status'] == 'queued' and other_status['submitted_at'] < submitted_at: position += 1
+        return position
+
+    def result(self, job_id):
+        job_dir = self._job_dir(job_id)
+        if job_dir is None: return None
+        result_path = os.path.join(job_dir, 'result.json')
+        if not os.path.exists(result_path): return None
+        return _result_from_json(_read_json(result_path))
+
+    def request_stop(self, job_id):
+        job_dir = self._job_dir(job_id)
+        if job_dir is not None and os.path.isdir(job_dir): open(os.path.join(job_dir, 'stop'), 'w').close()
+
+    def purge(self, keep_hours):
+        # 保存期間を過ぎたジョブのディレクトリを削除する
+        limit = time.time() - keep_hours * 3600
+        for job_id in os.listdir(self.job_root):
+            job_dir = self._job_dir(job_id)
+            if job_dir is None: continue
+            status_path = os.path.join(job_dir, 'status.json')
+            if os.path.exists(status_path) and os.path.getmtime(status_path) < limit:
+                shutil.rmtree(job_dir, ignore_errors=True)
@@ -0,0 +1,159 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from ortools.sat.python import cp_model
+
+from shift_solver import (DEFAULT_PARAMS, read_staff_csv, read_requests_csv, fill_missing_staff_names, build_params, build_shift_model,
+                          configure_solver, _create_schedule_df)
+from schedule_evaluator import evaluate_schedule
+
+# ペナルティ重みのスイープ
+#
+# 使い方:
+#   python penalty_sweep.py --staff staff.csv --requests requests.csv --month 2025-04 --grid '{"s0_penalty": [100, 200], "s4_penalty": [4, 8, 16]}'
+#
+# 制約モデルは1回だけ組み立て（コンパイル）、シナリオごとに目的関数の係数だけを差し替えて、ローカルのプロセスプールで並列に求解する。
+# 結果は各ソフト制約の違反数をシナリオごとに並べた表で、どの違反数でも他のシナリオに劣らない（非劣解の）シナリオに印を付ける。
+# 違反数・違反量はペナルティ変数の値ではなく、解いた勤務表から schedule_evaluator で数える（重みが0のルールも同じ基準で比べられる）。
+
+# ソフト制約ファミリーと、その重みを表すパラメータ名（S6 は「強化P」の切り替えを反映した実際の重みとして扱う）
+PENALTY_KEYS = {'S0': 's0_penalty', 'S1a': 's1a_penalty', 'S1b': 's1b_penalty', 'S1c': 's1c_penalty', 'S2': 's2_penalty',
+                'S3': 's3_penalty', 'S4': 's4_penalty', 'S5': 's5_penalty', 'S6': 's6_penalty'}
+
+# schedule_evaluator に渡す params のうち、ルールの設定以外に必要なもの
+_EVALUATION_KEYS = ['year', 'month', 'staff_df', 'requests_df', 'event_units', 'carry_in', 'h5_window_sundays', 'fixed_values', 'reference_values']
+
+def base_weights(params):
+    weights = {key: params.get(key) for key in PENALTY_KEYS.values()}
+    if params.get('high_flat_penalty'): weights['s6_penalty'] = params.get('s6_penalty_heavy', 4)
+    return weights
+
+def compile_sweep_model(params):
+    # モデルを組み立て、ワーカープロセスに渡せるようにテキスト形式の proto と、ペナルティ項の変数番号にしておく
+    model, _ = build_shift_model(params)
+    family_terms = {}
+    for family in PENALTY_KEYS:
+        if family not in params['penalty_terms']: continue
+        # 否定リテラル（S5 の「配置されていない」）は負の番号で表されるので、(変数番号, 否定かどうか) に直す
+        family_terms[family] = [(term.Index(), False) if term.Index() >= 0 else (-term.Index() - 1, True) for _, term in params['penalty_terms'][family]]
+    evaluation_params = {key: params.get(key, default) for key, default in DEFAULT_PARAMS.items()}
+    evaluation_params.update({key: params[key] for key in _EVALUATION_KEYS if key in params})
+    return {'model_text': str(model.Proto()), 'family_terms': family_terms, 'shift_index': params['shift_index'],
+            'request_arrays': params['request_arrays'], 'evaluation_params': evaluation_params}
+
+def expand_penalty_grid(grid, base):
+    # {'s0_penalty': [100, 200], ...} の直積を、base の重みを上書きしたシナリオの一覧に展開する
+    keys = list(grid)
+    return [dict(base, **dict(zip(keys, values))) for values in itertools.product(*(grid[key] for key in keys))]
+
+_worker_model = None
+_worker_terms = None
+_worker_compiled = None
+
+def _init_worker(compiled):
+    global _worker_model, _worker_terms, _worker_compiled
+    _worker_model = cp_model.CpModel(); _worker_model.Proto().parse_text_format(compiled['model_text'])
+    _worker_terms = {family: [(_worker_model.GetBoolVarFromProtoIndex(index).Not() if negated else _worker_model.GetIntVarFromProtoIndex(index))
+                              for index, negated in terms] for family, terms in compiled['family_terms'].items()}
+    _worker_compiled = compiled
+
+def _solve_scenario(scenario_id, weights, solver_params):
+    variables, coefficients = [], []
+    for family, terms in _worker_terms.items():
+        weight = int(weights[PENALTY_KEYS[family]])
+        variables.extend(terms); coefficients.extend([weight] * len(terms))
+    _worker_model.Minimize(cp_model.LinearExpr.WeightedSum(variables, coefficients))
+    solver = cp_model.CpSolver(); configure_solver(solver, solver_params)
+    status = solver.Solve(_worker_model)
+    row = {'scenario': scenario_id, **weights, 'status': solver.StatusName(status), 'objective': None}
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        row['objective'] = solver.ObjectiveValue()
+        shift_matrix = np.asarray(solver.ResponseProto().solution, dtype=np.int64)[_worker_compiled['shift_index']].astype(np.int8)
+        evaluation_params = _worker_compiled['evaluation_params']
+        schedule_df = _create_schedule_df(shift_matrix, _worker_compiled['request_arrays'], evaluation_params['staff_df'])
+        evaluation = evaluate_schedule(schedule_df, evaluation_params)
+        violations = evaluation['families'].set_index('family')['violations']
+        amounts = evaluation['soft_terms'].groupby('family')['value'].sum()
+        for family in _worker_terms:
+            row[f'{family}_違反数'] = int(violations.get(family, 0))
+            row[f'{family}_違反量'] = int(amounts.get(family, 0))
+    return row
+
+def mark_non_dominated(result_df, columns):
+    # 全ての違反数で他のシナリオ以下、かつどれかで真に小さいシナリオがなければ非劣解とする
+    solved = result_df['objective'].notna().to_numpy()
+    values = result_df[columns].fillna(0).to_numpy()
+    flags = []
+    for i in range(len(result_df)):
+        dominated = any(solved[j] and (values[j] <= values[i]).all() and (values[j] < values[i]).any() for j in range(len(result_df)) if j != i)
+        flags.append(bool(solved[i]) and not dominated)
+    result_df['非劣解'] = flags
+    return result_df
+
+def sweep_solver_params(params, max_workers, time_limit=None):
+    return {'time_limit': time_limit or params.get('time_limit', 60.0),
+            'num_workers': max(1, (os.cpu_count() or 1) // max_workers), 'random_seed': params.get('random_seed', 0)}
+
+def solve_sweep_scenario(compiled, scenario_id, weights, solver_params):
+    # コンパイル済みのモデルで1シナリオだけを解く（求解ジョブのキューから、シナリオごとのジョブとして使う）
+    _init_worker(compiled)
+    return _solve_scenario(scenario_id, weights, solver_params)
+
+def sweep_result_frame(rows, compiled):
+    # シナリオごとの結果を表にまとめ、非劣解に印を付ける
+    result_df = pd.DataFrame(rows).sort_values('scenario', ignore_index=True)
+    count_columns = [f'{family}_違反数' for family in compiled['family_terms'] if f'{family}_違反数' in result_df.columns]
+    return mark_non_dominated(result_df, count_columns)
+
+def run_penalty_sweep(params, scenarios, max_workers=None, time_limit=None):
+    compiled = compile_sweep_model(params)
+    max_workers = max_workers or min(len(scenarios), os.cpu_count() or 1)
+    solver_params = sweep_solver_params(params, max_workers, time_limit)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(compiled,)) as executor:
+        futures = [executor.submit(_solve_scenario, i, weights, solver_params) for i, weights in enumerate(scenarios)]
+        rows = [future.result() for future in futures]
+    return sweep_result_frame(rows, compiled)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ペナルティ重みの組み合わせを並列に試し、違反数を比較します。')
+    parser.add_argument('--staff', required=True, help='職員一覧CSV')
+    parser.add_argument('--requests', required=True, help='希望休一覧CSV')
+    parser.add_argument('--month', required=True, help='対象年月 (例: 2025-04)')
+    parser.add_argument('--params', help='パラメータファイル(JSON)')
+    parser.add_argument('--grid', help='重みのグリッド (JSON文字列またはファイル)。例: {"s0_penalty": [100, 200]}')
+    parser.add_argument('--scenarios', help='重みの組のリスト (JSON文字列またはファイル)。例: [{"s0_penalty": 100}, {"s4_penalty": 16}]')
+    parser.add_argument('--workers', type=int, default=None, help='同時に解くシナリオ数（既定: CPUコア数）')
+    parser.add_argument('--time-limit', type=float, default=None, help='1シナリオあたりの制限時間（秒）')
+    parser.add_argument('--output', help='結果を書き出すCSVファイル')
+    args = parser.parse_args(argv)
+
+    def load_json(value):
+        if os.path.exists(value):
+            with open(value, encoding='utf-8') as f: return json.load(f)
+        return json.loads(value)
+
+    overrides = load_json(args.params) if args.params else {}
+    year, month = (int(x) for x in args.month.split('-'))
+    staff_df = read_staff_csv(args.staff); requests_df = read_requests_csv(args.requests)
+    fill_missing_staff_names(staff_df)
+    event_units = overrides.pop('event_units', None)
+    params = build_params(staff_df, requests_df, year, month, event_units, **overrides)
+
+    base = base_weights(params)
+    scenarios = []
+    if args.grid: scenarios += expand_penalty_grid(load_json(args.grid), base)
+    if args.scenarios: scenarios += [dict(base, **weights) for weights in load_json(args.scenarios)]
+    if not scenarios: parser.error('--grid か --scenarios でシナリオを指定してください。')
+
+    result_df = run_penalty_sweep(params, scenarios, args.workers, args.time_limit)
+    print(result_df.to_string(index=False))
+    if args.output: result_df.to_csv(args.output, index=False)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
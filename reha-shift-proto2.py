@@ -1,271 +1,22 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from ortools.sat.python import cp_model
 import calendar
 import io
+import os
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
+from shift_solver import read_staff_csv, read_requests_csv, check_input_columns, fill_missing_staff_names, export_excel, REQUEST_TYPES
+from solve_cache import SolveCache, cached_result
+from job_queue import SolveJobQueue, JOB_STATUSES_FINISHED
+from penalty_sweep import base_weights, compile_sweep_model, sweep_solver_params, sweep_result_frame
+from incremental_solve import apply_request_changes
+from schedule_evaluator import evaluate_schedule
 
 # ★★★ バージョン情報 ★★★
 APP_VERSION = "proto.2.2.3" # ファイルチェック機能強化版
 APP_CREDIT = "Okuno with 🤖 Gemini and Claude"
 
-# --- ヘルパー関数: サマリー作成 ---
-def _create_summary(schedule_df, staff_info_dict, year, month, event_units, all_half_day_requests):
-    num_days = calendar.monthrange(year, month)[1]; days = list(range(1, num_days + 1)); daily_summary = []
-    schedule_df.columns = [col if isinstance(col, str) else int(col) for col in schedule_df.columns]
-    for d in days:
-        day_info = {}; 
-        work_symbols = ['', '○', '出', 'AM休', 'PM休', 'AM有', 'PM有']
-        work_staff_ids = schedule_df[schedule_df[d].isin(work_symbols)]['職員番号']
-        half_day_staff_ids = [s for s, dates in all_half_day_requests.items() if d in dates]
-        total_workers = sum(0.5 if sid in half_day_staff_ids else 1 for sid in work_staff_ids)
-        day_info['日'] = d; day_info['曜日'] = ['月','火','水','木','金','土','日'][calendar.weekday(year, month, d)]
-        day_info['出勤者総数'] = total_workers
-        day_info['PT'] = sum(0.5 if sid in half_day_staff_ids else 1 for sid in work_staff_ids if staff_info_dict[sid]['職種'] == '理学療法士')
-        day_info['OT'] = sum(0.5 if sid in half_day_staff_ids else 1 for sid in work_staff_ids if staff_info_dict[sid]['職種'] == '作業療法士')
-        day_info['ST'] = sum(0.5 if sid in half_day_staff_ids else 1 for sid in work_staff_ids if staff_info_dict[sid]['職種'] == '言語聴覚士')
-        day_info['役職者'] = sum(0.5 if sid in half_day_staff_ids else 1 for sid in work_staff_ids if pd.notna(staff_info_dict[sid]['役職']))
-        day_info['回復期'] = sum(0.5 if sid in half_day_staff_ids else 1 for sid in work_staff_ids if staff_info_dict[sid].get('役割1') == '回復期専従')
-        day_info['地域包括'] = sum(0.5 if sid in half_day_staff_ids else 1 for sid in work_staff_ids if staff_info_dict[sid].get('役割1') == '地域包括専従')
-        day_info['外来'] = sum(0.5 if sid in half_day_staff_ids else 1 for sid in work_staff_ids if staff_info_dict[sid].get('役割1') == '外来PT')
-        if calendar.weekday(year, month, d) != 6:
-            pt_units = sum(int(staff_info_dict[sid]['1日の単位数']) * (0.5 if sid in half_day_staff_ids else 1) for sid in work_staff_ids if staff_info_dict[sid]['職種'] == '理学療法士')
-            ot_units = sum(int(staff_info_dict[sid]['1日の単位数']) * (0.5 if sid in half_day_staff_ids else 1) for sid in work_staff_ids if staff_info_dict[sid]['職種'] == '作業療法士')
-            st_units = sum(int(staff_info_dict[sid]['1日の単位数']) * (0.5 if sid in half_day_staff_ids else 1) for sid in work_staff_ids if staff_info_dict[sid]['職種'] == '言語聴覚士')
-            day_info['PT単位数'] = pt_units; day_info['OT単位数'] = ot_units; day_info['ST単位数'] = st_units
-            day_info['PT+OT単位数'] = pt_units + ot_units
-            total_event_unit = event_units['all'].get(d, 0) + event_units['pt'].get(d, 0) + event_units['ot'].get(d, 0) + event_units['st'].get(d, 0)
-            day_info['特別業務単位数'] = total_event_unit
-        else:
-            day_info['PT単位数'] = '-'; day_info['OT単位数'] = '-'; day_info['ST単位数'] = '-';
-            day_info['PT+OT単位数'] = '-'; day_info['特別業務単位数'] = '-'
-        daily_summary.append(day_info)
-    return pd.DataFrame(daily_summary)
-
-def _create_schedule_df(shifts_values, staff, days, staff_df, requests_map):
-    schedule_data = {}
-    for s in staff:
-        row = []
-        s_requests = requests_map.get(s, {})
-        for d in days:
-            request_type = s_requests.get(d)
-            if shifts_values.get((s, d), 0) == 0: # 休みの場合
-                if request_type == '×': row.append('×')
-                elif request_type == '△': row.append('△')
-                elif request_type == '有': row.append('有')
-                elif request_type == '特': row.append('特')
-                elif request_type == '夏': row.append('夏')
-                else: row.append('-')
-            else: # 出勤の場合
-                if request_type == '○': row.append('○')
-                elif request_type in ['AM休', 'PM休', 'AM有', 'PM有']: row.append(request_type)
-                elif request_type == '△': row.append('出')
-                else: row.append('')
-        schedule_data[s] = row
-    schedule_df = pd.DataFrame.from_dict(schedule_data, orient='index', columns=days)
-    schedule_df = schedule_df.reset_index().rename(columns={'index': '職員番号'})
-    staff_map = staff_df.set_index('職員番号')
-    schedule_df.insert(1, '職員名', schedule_df['職員番号'].map(staff_map['職員名']))
-    schedule_df.insert(2, '職種', schedule_df['職員番号'].map(staff_map['職種']))
-    return schedule_df
-
-# --- メインのソルバー関数 ---
-def solve_shift_model(params):
-    year, month = params['year'], params['month']
-    num_days = calendar.monthrange(year, month)[1]; days = list(range(1, num_days + 1)); staff = params['staff_df']['職員番号'].tolist()
-    staff_info = params['staff_df'].set_index('職員番号').to_dict('index')
-    params['staff_info'] = staff_info 
-    params['staff'] = staff 
-    sundays = [d for d in days if calendar.weekday(year, month, d) == 6]; weekdays = [d for d in days if d not in sundays]
-    params['sundays'] = sundays; params['weekdays'] = weekdays; params['days'] = days 
-    
-    managers = [s for s in staff if pd.notna(staff_info[s]['役職'])]; pt_staff = [s for s in staff if staff_info[s]['職種'] == '理学療法士']
-    ot_staff = [s for s in staff if staff_info[s]['職種'] == '作業療法士']; st_staff = [s for s in staff if staff_info[s]['職種'] == '言語聴覚士']
-    params['pt_staff'] = pt_staff; params['ot_staff'] = ot_staff; params['st_staff'] = st_staff 
-    
-    kaifukuki_staff = [s for s in staff if staff_info[s].get('役割1') == '回復期専従']; kaifukuki_pt = [s for s in kaifukuki_staff if staff_info[s]['職種'] == '理学療法士']
-    kaifukuki_ot = [s for s in kaifukuki_staff if staff_info[s]['職種'] == '作業療法士']; gairai_staff = [s for s in staff if staff_info[s].get('役割1') == '外来PT']
-    chiiki_staff = [s for s in staff if staff_info[s].get('役割1') == '地域包括専従']; sunday_off_staff = gairai_staff + chiiki_staff
-    params['kaifukuki_pt'] = kaifukuki_pt; params['kaifukuki_ot'] = kaifukuki_ot; params['gairai_staff'] = gairai_staff 
-    job_types = {'PT': pt_staff, 'OT': ot_staff, 'ST': st_staff}
-    params['job_types'] = job_types 
-    
-    requests_map = {s: {} for s in staff}
-    request_types = ['×', '△', '○', '有', '特', '夏', 'AM有', 'PM有', 'AM休', 'PM休']
-    for index, row in params['requests_df'].iterrows():
-        staff_id = row['職員番号']
-        if staff_id not in staff: continue
-        for d in days:
-            col_name = str(d)
-            if col_name in row and pd.notna(row[col_name]) and row[col_name] in request_types:
-                requests_map[staff_id][d] = row[col_name]
-    params['requests_map'] = requests_map
-
-    model = cp_model.CpModel(); shifts = {}
-    for s in staff:
-        for d in days: shifts[(s, d)] = model.NewBoolVar(f'shift_{s}_{d}')
-
-    if params['h1_on']:
-        for s in staff:
-            s_reqs = requests_map.get(s, {})
-            num_paid_leave = sum(1 for r in s_reqs.values() if r == '有')
-            num_special_leave = sum(1 for r in s_reqs.values() if r == '特')
-            num_summer_leave = sum(1 for r in s_reqs.values() if r == '夏')
-            num_half_kokyu = sum(1 for r in s_reqs.values() if r in ['AM休', 'PM休'])
-            
-            full_holidays_total = sum(1 - shifts[(s, d)] for d in days)
-            
-            full_holidays_kokyu = model.NewIntVar(0, num_days, f'full_kokyu_{s}')
-            model.Add(full_holidays_kokyu == full_holidays_total - num_paid_leave - num_special_leave - num_summer_leave)
-            
-            model.Add(2 * full_holidays_kokyu + num_half_kokyu == 18)
-
-    if params['h2_on']:
-        for s, reqs in requests_map.items():
-            for d, req_type in reqs.items():
-                if req_type in ['×', '有', '特', '夏']: model.Add(shifts[(s, d)] == 0)
-                elif req_type in ['○', 'AM有', 'PM有', 'AM休', 'PM休']: model.Add(shifts[(s, d)] == 1)
-
-    if params['h3_on']:
-        for d in days: model.Add(sum(shifts[(s, d)] for s in managers) >= 1)
-    if params['h4_on']:
-        for s in sunday_off_staff:
-            for d in sundays: model.Add(shifts[(s, d)] == 0)
-    if params['h5_on']:
-        for s in staff: model.Add(sum(shifts[(s, d)] for d in sundays) <= 2)
-    
-    penalties = []
-    
-    if params['s4_on']:
-        for s, reqs in requests_map.items():
-            for d, req_type in reqs.items():
-                if req_type == '△':
-                    penalties.append(params['s4_penalty'] * shifts[(s, d)])
-
-    if params['s0_on'] or params['s2_on']:
-        weeks_in_month = []; current_week = []
-        for d in days:
-            current_week.append(d)
-            if calendar.weekday(year, month, d) == 5 or d == num_days: weeks_in_month.append(current_week); current_week = []
-        params['weeks_in_month'] = weeks_in_month
-        
-        for s_idx, s in enumerate(staff):
-            s_reqs = requests_map.get(s, {})
-            all_full_requests = {d for d, r in s_reqs.items() if r in ['×', '有', '特', '夏', '△']}
-            all_half_day_requests = {d for d, r in s_reqs.items() if r in ['AM有', 'PM有', 'AM休', 'PM休']}
-
-            for w_idx, week in enumerate(weeks_in_month):
-                if sum(1 for d in week if d in all_full_requests) >= 3: continue
-                
-                num_full_holidays_in_week = sum(1 - shifts[(s, d)] for d in week)
-                
-                num_half_holidays_in_week = sum(shifts[(s, d)] for d in week if d in all_half_day_requests)
-
-                total_holiday_value = model.NewIntVar(0, 28, f'thv_s{s_idx}_w{w_idx}')
-                model.Add(total_holiday_value == 2 * num_full_holidays_in_week + num_half_holidays_in_week)
-
-                if len(week) == 7 and params['s0_on']:
-                    violation = model.NewBoolVar(f'f_w_v_s{s_idx}_w{w_idx}'); model.Add(total_holiday_value < 3).OnlyEnforceIf(violation); model.Add(total_holiday_value >= 3).OnlyEnforceIf(violation.Not()); penalties.append(params['s0_penalty'] * violation)
-                elif len(week) < 7 and params['s2_on']:
-                    violation = model.NewBoolVar(f'p_w_v_s{s_idx}_w{w_idx}'); model.Add(total_holiday_value < 1).OnlyEnforceIf(violation); model.Add(total_holiday_value >= 1).OnlyEnforceIf(violation.Not()); penalties.append(params['s2_penalty'] * violation)
-    
-    if any([params['s1a_on'], params['s1b_on'], params['s1c_on']]):
-        for d in sundays:
-            pt_on_sunday = sum(shifts[(s, d)] for s in pt_staff); ot_on_sunday = sum(shifts[(s, d)] for s in ot_staff); st_on_sunday = sum(shifts[(s, d)] for s in st_staff)
-            if params['s1a_on']:
-                total_pt_ot = pt_on_sunday + ot_on_sunday; total_diff = model.NewIntVar(-50, 50, f't_d_{d}'); model.Add(total_diff == total_pt_ot - (params['target_pt'] + params['target_ot'])); abs_total_diff = model.NewIntVar(0, 50, f'a_t_d_{d}'); model.AddAbsEquality(abs_total_diff, total_diff); penalties.append(params['s1a_penalty'] * abs_total_diff)
-            if params['s1b_on']:
-                pt_diff = model.NewIntVar(-30, 30, f'p_d_{d}'); model.Add(pt_diff == pt_on_sunday - params['target_pt']); pt_penalty = model.NewIntVar(0, 30, f'p_p_{d}'); model.Add(pt_penalty >= pt_diff - params['tolerance']); model.Add(pt_penalty >= -pt_diff - params['tolerance']); penalties.append(params['s1b_penalty'] * pt_penalty)
-                ot_diff = model.NewIntVar(-30, 30, f'o_d_{d}'); model.Add(ot_diff == ot_on_sunday - params['target_ot']); ot_penalty = model.NewIntVar(0, 30, f'o_p_{d}'); model.Add(ot_penalty >= ot_diff - params['tolerance']); model.Add(ot_penalty >= -ot_diff - params['tolerance']); penalties.append(params['s1b_penalty'] * ot_penalty)
-            if params['s1c_on']:
-                st_diff = model.NewIntVar(-10, 10, f's_d_{d}'); model.Add(st_diff == st_on_sunday - params['target_st']); abs_st_diff = model.NewIntVar(0, 10, f'a_s_d_{d}'); model.AddAbsEquality(abs_st_diff, st_diff); penalties.append(params['s1c_penalty'] * abs_st_diff)
-    if params['s3_on']:
-        for d in days:
-            num_gairai_off = sum(1 - shifts[(s, d)] for s in gairai_staff); penalty = model.NewIntVar(0, len(gairai_staff), f'g_p_{d}'); model.Add(penalty >= num_gairai_off - 1); penalties.append(params['s3_penalty'] * penalty)
-    if params['s5_on']:
-        for d in days:
-            kaifukuki_pt_on = sum(shifts[(s, d)] for s in kaifukuki_pt)
-            kaifukuki_ot_on = sum(shifts[(s, d)] for s in kaifukuki_ot)
-            model.Add(kaifukuki_pt_on + kaifukuki_ot_on >= 1)
-            pt_present = model.NewBoolVar(f'k_p_p_{d}'); ot_present = model.NewBoolVar(f'k_o_p_{d}'); model.Add(kaifukuki_pt_on >= 1).OnlyEnforceIf(pt_present); model.Add(kaifukuki_pt_on == 0).OnlyEnforceIf(pt_present.Not()); model.Add(kaifukuki_ot_on >= 1).OnlyEnforceIf(ot_present); model.Add(kaifukuki_ot_on == 0).OnlyEnforceIf(ot_present.Not()); penalties.append(params['s5_penalty'] * (1 - pt_present)); penalties.append(params['s5_penalty'] * (1 - ot_present))
-    
-    if params['s6_on']:
-        unit_penalty_weight = params.get('s6_penalty_heavy', 4) if params.get('high_flat_penalty') else params.get('s6_penalty', 2)
-        event_units = params['event_units']
-        all_half_day_requests = {s: {d for d, r in reqs.items() if r in ['AM有', 'PM有', 'AM休', 'PM休']} for s, reqs in requests_map.items()}
-
-        total_weekday_units_by_job = {}
-        for job, members in job_types.items():
-            if not members:
-                total_weekday_units_by_job[job] = 0
-                continue
-            total_units = sum(int(staff_info[s]['1日の単位数']) * (len(weekdays) / num_days) * (num_days - 9 - sum(1 for r in requests_map.get(s, {}).values() if r in ['有','特','夏'])) for s in members)
-            total_weekday_units_by_job[job] = total_units
-        
-        total_all_jobs_units = sum(total_weekday_units_by_job.values())
-        ratios = {job: total_units / total_all_jobs_units if total_all_jobs_units > 0 else 0 for job, total_units in total_weekday_units_by_job.items()}
-        
-        avg_residual_units_by_job = {}
-        total_event_units_all = sum(event_units['all'].values())
-        
-        for job, members in job_types.items():
-            if not weekdays or not members:
-                avg_residual_units_by_job[job] = 0
-                continue
-            total_event_units_job = sum(event_units[job.lower()].values())
-            total_event_units_for_job = total_event_units_job + (total_event_units_all * ratios.get(job, 0))
-            avg_residual_units_by_job[job] = (total_weekday_units_by_job.get(job, 0) - total_event_units_for_job) / len(weekdays)
-
-        params['avg_residual_units_by_job'] = avg_residual_units_by_job
-        params['ratios'] = ratios
-
-        for job, members in job_types.items():
-            if not members: continue
-            avg_residual_units = avg_residual_units_by_job.get(job, 0)
-            ratio = ratios.get(job, 0)
-            
-            for d in weekdays:
-                provided_units_expr_list = []
-                for s in members:
-                    unit = int(staff_info[s]['1日の単位数'])
-                    is_half = d in all_half_day_requests.get(s, set())
-                    constant_unit = int(unit * 0.5) if is_half else unit
-
-                    term = model.NewIntVar(0, constant_unit, f'p_u_s{s}_d{d}')
-                    model.Add(term == shifts[(s,d)] * constant_unit)
-                    provided_units_expr_list.append(term)
-                
-                provided_units_expr = sum(provided_units_expr_list)
-                
-                event_unit_for_day = event_units[job.lower()].get(d, 0) + (event_units['all'].get(d, 0) * ratio)
-                
-                residual_units_expr = model.NewIntVar(-4000, 4000, f'r_{job}_{d}')
-                model.Add(residual_units_expr == provided_units_expr - round(event_unit_for_day))
-                
-                diff_expr = model.NewIntVar(-4000, 4000, f'u_d_{job}_{d}')
-                model.Add(diff_expr == residual_units_expr - round(avg_residual_units))
-                
-                abs_diff_expr = model.NewIntVar(0, 4000, f'a_u_d_{job}_{d}')
-                model.AddAbsEquality(abs_diff_expr, diff_expr)
-                penalties.append(unit_penalty_weight * abs_diff_expr)
-
-    model.Minimize(sum(penalties))
-    solver = cp_model.CpSolver(); solver.parameters.max_time_in_seconds = 60.0; status = solver.Solve(model)
-    
-    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-        shifts_values = {(s, d): solver.Value(shifts[(s, d)]) for s in staff for d in days}
-        all_half_day_requests = {s: {d for d, r in reqs.items() if r in ['AM有', 'PM有', 'AM休', 'PM休']} for s, reqs in requests_map.items()}
-        schedule_df = _create_schedule_df(shifts_values, staff, days, params['staff_df'], requests_map)
-        summary_df = _create_summary(schedule_df, staff_info, year, month, params['event_units'], all_half_day_requests)
-        message = f"求解ステータス: **{solver.StatusName(status)}** (ペナルティ合計: **{round(solver.ObjectiveValue())}**)"
-        
-        return True, schedule_df, summary_df, message, all_half_day_requests
-    else:
-        message = f"致命的なエラー: ハード制約が矛盾しているため、勤務表を作成できませんでした。({solver.StatusName(status)})"
-        return False, pd.DataFrame(), pd.DataFrame(), message, None
-
 # --- Streamlit UI ---
 st.set_page_config(layout="wide")
 st.title('リハビリテーション科 勤務表作成アプリ')
@@ -295,40 +46,41 @@ with st.expander("▼ 各種パラメータを設定する", expanded=True):
     
     st.markdown("---")
     st.subheader(f"{year}年{month}月のイベント設定（各日の特別業務単位数を入力）")
-    st.info("「全体」タブは職種を問わない業務、「PT/OT/ST」タブは各職種固有の業務を入力します。「全体」に入力された業務は、各職種の標準的な業務量比で自動的に按分されます。")
-    
-    event_tabs = st.tabs(["全体", "PT", "OT", "ST"])
-    event_units_input = {'all': {}, 'pt': {}, 'ot': {}, 'st': {}}
+    st.info("「全体」は職種を問わない業務、「PT/OT/ST」は各職種固有の業務を入力します。「全体」に入力された業務は、各職種の標準的な業務量比で自動的に按分されます。")
     
-    for i, tab_name in enumerate(['all', 'pt', 'ot', 'st']):
-        with event_tabs[i]:
-            day_counter = 1
-            num_days_in_month = calendar.monthrange(year, month)[1]
-            first_day_weekday = calendar.weekday(year, month, 1)
-            
-            cal_cols = st.columns(7)
-            weekdays_jp = ['月', '火', '水', '木', '金', '土', '日']
-            for day_idx, day_name in enumerate(weekdays_jp): cal_cols[day_idx].markdown(f"<p style='text-align: center;'><b>{day_name}</b></p>", unsafe_allow_html=True)
-            
-            for week_num in range(6):
-                cols = st.columns(7)
-                for day_of_week in range(7):
-                    if (week_num == 0 and day_of_week < first_day_weekday) or day_counter > num_days_in_month:
-                        cols[day_of_week].empty()
-                        continue
-                    with cols[day_of_week]:
-                        is_sunday = calendar.weekday(year, month, day_counter) == 6
-                        event_units_input[tab_name][day_counter] = st.number_input(
-                            label=f"{day_counter}日", value=0, step=10, disabled=is_sunday, 
-                            key=f"event_{tab_name}_{year}_{month}_{day_counter}"
-                        )
-                    day_counter += 1
-                if day_counter > num_days_in_month: break
+    # 入力欄は選択中の職種の分だけ描画し、入力済みの値は年月・職種ごとにセッションへ保持する
+    event_tab_labels = {'all': '全体', 'pt': 'PT', 'ot': 'OT', 'st': 'ST'}
+    event_tab = st.radio("職種", options=list(event_tab_labels), format_func=event_tab_labels.get, horizontal=True, key='event_tab', label_visibility='collapsed')
+    event_units_store = st.session_state.setdefault('event_units_store', {}).setdefault((year, month), {'all': {}, 'pt': {}, 'ot': {}, 'st': {}})
+    num_days_in_month = calendar.monthrange(year, month)[1]
+    first_day_weekday = calendar.weekday(year, month, 1)
+    day_counter = 1
+
+    cal_cols = st.columns(7)
+    weekdays_jp = ['月', '火', '水', '木', '金', '土', '日']
+    for day_idx, day_name in enumerate(weekdays_jp): cal_cols[day_idx].markdown(f"<p style='text-align: center;'><b>{day_name}</b></p>", unsafe_allow_html=True)
+
+    for week_num in range(6):
+        cols = st.columns(7)
+        for day_of_week in range(7):
+            if (week_num == 0 and day_of_week < first_day_weekday) or day_counter > num_days_in_month:
+                cols[day_of_week].empty()
+                continue
+            with cols[day_of_week]:
+                is_sunday = calendar.weekday(year, month, day_counter) == 6
+                event_units_store[event_tab][day_counter] = st.number_input(
+                    label=f"{day_counter}日", value=event_units_store[event_tab].get(day_counter, 0), step=10, disabled=is_sunday,
+                    key=f"event_{event_tab}_{year}_{month}_{day_counter}"
+                )
+            day_counter += 1
+        if day_counter > num_days_in_month: break
+    event_units_input = {tab_name: {d: event_units_store[tab_name].get(d, 0) for d in range(1, num_days_in_month + 1)} for tab_name in event_tab_labels}
 
     st.markdown("---")
     create_button = st.button('勤務表を作成', type="primary", use_container_width=True)
 
-with st.expander("▼ ルール検証モード（上級者向け）"):
+rule_expander = st.expander("▼ ルール検証モード（上級者向け）")
+with rule_expander:
     st.warning("注意: 各ルールのON/OFFやペナルティ値を変更することで、意図しない結果や、解が見つからない状況が発生する可能性があります。")
     st.markdown("---")
     st.subheader("ハード制約のON/OFF")
@@ -365,7 +117,7 @@ with st.expander("▼ ルール検証モード（上級者向け）"):
         params_ui['s6_penalty'] = c_s6_1.number_input("S6 標準P", value=2, disabled=not params_ui['s6_on'], key='s6p')
         params_ui['s6_penalty_heavy'] = c_s6_2.number_input("S6 強化P", value=4, disabled=not params_ui['s6_on'], key='s6ph')
     with s_cols2[2]:
-        st.markdown("") 
+        params_ui['s6_encoding'] = 'legacy' if st.toggle('S6: 旧定式化で求解', value=False, disabled=not params_ui['s6_on'], key='s6_legacy', help="S6を職員×日ごとの中間変数を使う従来の定式化で組み立てます（比較・検証用）。") else 'compact'
     with s_cols2[3]:
         params_ui['high_flat_penalty'] = st.toggle('平準化ペナルティ強化', value=False, key='high_flat', help="S6のペナルティを「標準P」ではなく「強化P」で計算します。")
         
@@ -381,64 +133,78 @@ with st.expander("▼ ルール検証モード（上級者向け）"):
         params_ui['s1c_on'] = st.toggle('S1-c: ST目標', value=True, key='s1c')
         params_ui['s1c_penalty'] = st.number_input("S1-c Penalty", value=60, disabled=not params_ui['s1c_on'], key='s1cp')
 
+    st.markdown("---")
+    st.subheader("ソルバー設定")
+    solver_cols = st.columns(4)
+    with solver_cols[0]: params_ui['time_limit'] = st.number_input("制限時間（秒）", min_value=1, value=60, step=10, key='time_limit')
+    with solver_cols[1]: params_ui['num_workers'] = st.number_input("探索スレッド数", min_value=1, value=os.cpu_count() or 1, step=1, key='num_workers', help="既定ではCPUコア数をすべて使います。複数の求解が同時に動く場合は、コア数を同時実行数で割った値が上限になります。")
+    with solver_cols[2]: params_ui['relative_gap_limit'] = st.number_input("許容ギャップ（%）", min_value=0.0, max_value=100.0, value=0.0, step=1.0, key='gap_limit', help="最良解と下界の差がこの割合以下になったら探索を打ち切ります。0なら最適性を証明するまで探索します。") / 100
+    with solver_cols[3]: params_ui['deterministic'] = st.toggle('決定的な探索', value=False, key='deterministic', help="同じ入力なら毎回同じ勤務表になるように探索します。制限時間は決定的時間の上限と実時間の上限の両方に使い、実時間で先に打ち切った場合は結果が再現されません。")
+    params_ui['symmetry_breaking'] = st.toggle('入れ替え可能な職員の対称性を除去', value=False, key='symmetry_breaking', help="職種・役割・単位数が同じで役職も希望もない職員どうしの勤務パターンに順序を付け、同じ勤務表の並べ替えを探索しないようにします（検証用。CP-SATの前処理でも対称性は検出されるため、入力によっては遅くなります）。")
+
+# --- 求解はジョブキューに投入し、全ユーザーで共有するプロセスプールで実行する ---
+# 同時に実行する求解の数は REHA_SHIFT_MAX_SOLVES で変更できる（既定: 2）。超えた分は順番待ちになる。
+MAX_CONCURRENT_SOLVES = int(os.environ.get('REHA_SHIFT_MAX_SOLVES', 2))
+JOB_DIR = os.environ.get('REHA_SHIFT_JOB_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs'))
+
+@st.cache_resource
+def _get_job_queue():
+    return SolveJobQueue(JOB_DIR, max_concurrent=MAX_CONCURRENT_SOLVES)
+
+# 画面を操作するたびにスクリプト全体が再実行されるため、アップロードされたCSVの読み込みと
+# Excelへの書き出しは、内容が同じなら前回の結果を使い回す
+@st.cache_data(max_entries=8, show_spinner=False)
+def _read_uploaded_staff(data):
+    return read_staff_csv(io.BytesIO(data))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _read_uploaded_requests(data):
+    return read_requests_csv(io.BytesIO(data))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _export_excel_bytes(schedule_df, summary_df):
+    return export_excel(schedule_df, summary_df)
+
+def collect_params():
+    # アップロードされたCSVと画面の設定値から params を組み立てる
+    params = {}
+    params.update(params_ui)
+    params['staff_df'] = _read_uploaded_staff(staff_file.getvalue())
+    params['requests_df'] = _read_uploaded_requests(requests_file.getvalue())
+    params['year'] = year; params['month'] = month
+    params['target_pt'] = target_pt; params['target_ot'] = target_ot; params['target_st'] = target_st
+    params['tolerance'] = tolerance; params['event_units'] = event_units_input
+    
+    # ★★★ 改善点: 必須列の存在チェック ★★★
+    input_errors = check_input_columns(params['staff_df'], params['requests_df'])
+    if input_errors:
+        for error in input_errors: st.error(error)
+        st.stop()
+    
+    if fill_missing_staff_names(params['staff_df']):
+        st.info("職員一覧に「職員名」列がなかったため、仮の職員名を生成しました。")
+    return params
+
 if create_button:
     if staff_file is not None and requests_file is not None:
         try:
-            params = {}
-            params.update(params_ui)
-            params['staff_df'] = pd.read_csv(staff_file, dtype={'職員番号': str})
-            params['requests_df'] = pd.read_csv(requests_file, dtype={'職員番号': str})
-            params['year'] = year; params['month'] = month
-            params['target_pt'] = target_pt; params['target_ot'] = target_ot; params['target_st'] = target_st
-            params['tolerance'] = tolerance; params['event_units'] = event_units_input
-            
-            # ★★★ 改善点: 必須列の存在チェック ★★★
-            required_staff_cols = ['職員番号', '職種', '1日の単位数']
-            missing_cols = [col for col in required_staff_cols if col not in params['staff_df'].columns]
-            if missing_cols:
-                st.error(f"エラー: 職員一覧CSVの必須列が不足しています。以下の列を追加してください: **{', '.join(missing_cols)}**")
-                st.stop()
-
-            if '職員番号' not in params['requests_df'].columns:
-                 st.error(f"エラー: 希望休一覧CSVに必須列 **'職員番号'** がありません。")
-                 st.stop()
-            
-            if '職員名' not in params['staff_df'].columns:
-                params['staff_df']['職員名'] = params['staff_df']['職種'] + " " + params['staff_df']['職員番号'].astype(str)
-                st.info("職員一覧に「職員名」列がなかったため、仮の職員名を生成しました。")
-            
-            is_feasible, schedule_df, summary_df, message, all_half_day_requests = solve_shift_model(params)
-            
-            st.info(message)
-            if is_feasible:
-                st.header("勤務表")
-                num_days = calendar.monthrange(year, month)[1]
-                
-                summary_T = summary_df.drop(columns=['日', '曜日']).T
-                summary_T.columns = list(range(1, num_days + 1))
-                summary_processed = summary_T.reset_index().rename(columns={'index': '職員名'})
-                summary_processed['職員番号'] = summary_processed['職員名'].apply(lambda x: f"_{x}")
-                summary_processed['職種'] = "サマリー"
-                summary_processed = summary_processed[['職員番号', '職員名', '職種'] + list(range(1, num_days + 1))]
-                
-                final_df_for_display = pd.concat([schedule_df, summary_processed], ignore_index=True)
-                days_header = list(range(1, num_days + 1))
-                weekdays_header = [ ['月','火','水','木','金','土','日'][calendar.weekday(year, month, d)] for d in days_header]
-                final_df_for_display.columns = pd.MultiIndex.from_tuples([('職員情報', '職員番号'), ('職員情報', '職員名'), ('職員情報', '職種')] + list(zip(days_header, weekdays_header)))
-                
-                def style_table(df):
-                    sunday_cols = [col for col in df.columns if col[1] == '日']
-                    styler = df.style.set_properties(**{'text-align': 'center'})
-                    for col in sunday_cols: styler = styler.set_properties(subset=[col], **{'background-color': '#fff0f0'})
-                    return styler
-                
-                output = io.BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    schedule_df.to_excel(writer, sheet_name='勤務表', index=False)
-                    summary_df.to_excel(writer, sheet_name='日別サマリー', index=False)
-                excel_data = output.getvalue()
-                st.download_button(label="📥 Excelでダウンロード", data=excel_data, file_name=f"schedule_{year}{month:02d}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-                st.dataframe(style_table(final_df_for_display))
+            params = collect_params()
+            if 'solve_cache' not in st.session_state: st.session_state['solve_cache'] = SolveCache()
+            st.session_state.pop('solve_result', None); st.session_state.pop('solve_report', None); st.session_state.pop('solve_job', None)
+            st.session_state.pop('changed_cells', None)
+            st.session_state['result_params'] = params
+            result = cached_result(params, st.session_state['solve_cache'])
+            if result is not None:
+                st.session_state['solve_result'] = (result, year, month)
+                st.session_state['solve_report'] = params.get('solve_report')
+                st.query_params.pop('job', None)
+            else:
+                hints = st.session_state['solve_cache'].hint_values(params)
+                if hints: params['hint_values'] = hints
+                job_id = _get_job_queue().submit(params, label=f'{year}年{month}月')
+                st.session_state['solve_job'] = {'job_id': job_id, 'params': params}
+                # ページを再読み込みしても同じジョブを表示できるよう、URLにジョブIDを残す
+                st.query_params['job'] = job_id
         
         except Exception as e:
             st.error(f'予期せぬエラーが発生しました: {e}')
@@ -446,5 +212,224 @@ if create_button:
     else:
         st.warning('職員一覧と希望休一覧の両方のファイルをアップロードしてください。')
 
+# 再読み込みでセッションが失われても、URLのジョブIDから結果（または実行中のジョブ）を復元する
+if 'solve_job' not in st.session_state and 'solve_result' not in st.session_state and 'job' in st.query_params:
+    st.session_state['solve_job'] = {'job_id': st.query_params['job'], 'params': None}
+
+@st.fragment(run_every=1.0)
+def _solve_job_panel(job_id):
+    status = _get_job_queue().status(job_id)
+    if status is None or status['status'] in JOB_STATUSES_FINISHED: st.rerun()
+    if status['status'] == 'queued':
+        ahead = status.get('queue_position', 0)
+        st.info(f"順番待ち中… 他の求解が終わりしだい開始します（先に待っているジョブ {ahead}件）。")
+    elif status['progress']:
+        latest = status['progress'][-1]
+        st.info(f"求解中… 改善解 {len(status['progress'])}件目: ペナルティ合計 **{round(latest['objective'])}** / 下界 **{round(latest['bound'])}** （経過 {latest['wall_time']:.1f}秒）")
+    else:
+        st.info("求解中… 最初の勤務表を探しています。")
+    st.button('現在の解で確定する', on_click=_get_job_queue().request_stop, args=(job_id,), help="これまでに見つかった最良の勤務表で探索を打ち切ります。")
+
+@st.fragment(run_every=1.0)
+def _sweep_job_panel(job_ids):
+    statuses = [_get_job_queue().status(job_id) for job_id in job_ids]
+    if all(status is None or status['status'] in JOB_STATUSES_FINISHED for status in statuses): st.rerun()
+    num_finished = sum(1 for status in statuses if status is None or status['status'] in JOB_STATUSES_FINISHED)
+    num_running = sum(1 for status in statuses if status is not None and status['status'] == 'running')
+    st.info(f"スイープ実行中… {num_finished} / {len(job_ids)} シナリオを求解しました（実行中 {num_running}件）。")
+
+if 'solve_job' in st.session_state:
+    solve_job = st.session_state['solve_job']
+    job_status = _get_job_queue().status(solve_job['job_id'])
+    if job_status is None:
+        st.warning('ジョブが見つかりませんでした。保存期間を過ぎた可能性があるため、もう一度作成してください。')
+        del st.session_state['solve_job']; st.query_params.pop('job', None)
+    elif job_status['status'] == 'done' and job_status.get('task') == 'incremental':
+        # 再作成で解が見つからなければ、前の勤務表を表示したままにする
+        job_result = _get_job_queue().result(solve_job['job_id'])
+        if job_result['result'][0]:
+            st.session_state['solve_result'] = (job_result['result'], job_status['year'], job_status['month'])
+            st.session_state['solve_report'] = job_result['report']
+            st.session_state['changed_cells'] = job_result['changed_cells'] or []
+            if solve_job.get('result_params') is not None: st.session_state['result_params'] = solve_job['result_params']
+        else:
+            st.error(job_result['result'][3])
+        del st.session_state['solve_job']
+    elif job_status['status'] == 'done':
+        job_result = _get_job_queue().result(solve_job['job_id'])
+        st.session_state['solve_result'] = (job_result['result'], job_status['year'], job_status['month'])
+        st.session_state['solve_report'] = job_result['report']
+        if solve_job['params'] is not None and 'solve_cache' in st.session_state:
+            st.session_state['solve_cache'].put(solve_job['params'], job_result['result'], job_result['shifts_values'], job_result['report'])
+        del st.session_state['solve_job']
+    elif job_status['status'] == 'failed':
+        st.error(job_status['message'])
+        del st.session_state['solve_job']; st.query_params.pop('job', None)
+    else:
+        _solve_job_panel(solve_job['job_id'])
+
+if 'solve_result' in st.session_state:
+    (is_feasible, schedule_df, summary_df, message, all_half_day_requests), result_year, result_month = st.session_state['solve_result']
+    st.info(message)
+    if is_feasible:
+        st.header("勤務表")
+        num_days = calendar.monthrange(result_year, result_month)[1]
+        
+        summary_T = summary_df.drop(columns=['日', '曜日']).T
+        summary_T.columns = list(range(1, num_days + 1))
+        summary_processed = summary_T.reset_index().rename(columns={'index': '職員名'})
+        summary_processed['職員番号'] = summary_processed['職員名'].apply(lambda x: f"_{x}")
+        summary_processed['職種'] = "サマリー"
+        summary_processed = summary_processed[['職員番号', '職員名', '職種'] + list(range(1, num_days + 1))]
+        
+        final_df_for_display = pd.concat([schedule_df, summary_processed], ignore_index=True)
+        days_header = list(range(1, num_days + 1))
+        weekdays_header = [ ['月','火','水','木','金','土','日'][calendar.weekday(result_year, result_month, d)] for d in days_header]
+        final_df_for_display.columns = pd.MultiIndex.from_tuples([('職員情報', '職員番号'), ('職員情報', '職員名'), ('職員情報', '職種')] + list(zip(days_header, weekdays_header)))
+        
+        def style_table(df):
+            sunday_cols = [col for col in df.columns if col[1] == '日']
+            styler = df.style.set_properties(**{'text-align': 'center'})
+            for col in sunday_cols: styler = styler.set_properties(subset=[col], **{'background-color': '#fff0f0'})
+            # 再作成で前回から変わったセルを黄色で示す
+            changed_cells = st.session_state.get('changed_cells')
+            if changed_cells:
+                row_of = {sid: i for i, sid in enumerate(schedule_df['職員番号'])}
+                highlight = pd.DataFrame('', index=df.index, columns=df.columns)
+                for s, d in changed_cells:
+                    if s in row_of: highlight.iat[row_of[s], 2 + d] = 'background-color: #fff3b0'
+                styler = styler.apply(lambda _: highlight, axis=None)
+            return styler
+        
+        excel_data = _export_excel_bytes(schedule_df, summary_df)
+        st.download_button(label="📥 Excelでダウンロード", data=excel_data, file_name=f"schedule_{result_year}{result_month:02d}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        st.dataframe(style_table(final_df_for_display))
+
+        # --- 希望の変更を反映して再作成（作成済みの勤務表はできるだけそのまま残す） ---
+        with st.expander("▼ 希望の変更を反映して再作成"):
+            st.caption("急な欠勤や追加の有休など、変わった希望だけを入力してください。希望を取り消す場合は「取消」を選びます。")
+            change_df = st.data_editor(pd.DataFrame({'職員番号': pd.Series(dtype=str), '日': pd.Series(dtype='Int64'), '希望': pd.Series(dtype=str)}),
+                                       num_rows="dynamic", hide_index=True, key='request_changes',
+                                       column_config={'職員番号': st.column_config.SelectboxColumn(options=schedule_df['職員番号'].tolist(), required=True),
+                                                      '日': st.column_config.NumberColumn(min_value=1, max_value=num_days, step=1, required=True),
+                                                      '希望': st.column_config.SelectboxColumn(options=REQUEST_TYPES + ['取消'], required=True)})
+            inc_cols = st.columns([2, 1, 1])
+            with inc_cols[0]: incremental_mode = st.radio("再作成の方法", ['neighbourhood', 'min_change'], horizontal=True, key='incremental_mode',
+                                                          format_func=lambda mode: {'neighbourhood': '変更の周辺だけ解き直す', 'min_change': '全体を解き直し、変更を最小にする'}[mode])
+            with inc_cols[1]: incremental_radius = st.number_input("周辺の日数（前後）", min_value=0, max_value=num_days, value=3, step=1, key='incremental_radius', disabled=incremental_mode != 'neighbourhood')
+            if inc_cols[2].button('変更を反映して再作成', key='run_incremental'):
+                changes = [(row['職員番号'], int(row['日']), None if row['希望'] == '取消' else row['希望']) for row in change_df.dropna().to_dict('records')]
+                if not changes:
+                    st.warning('変更された希望を1件以上入力してください。')
+                elif staff_file is None or requests_file is None:
+                    st.warning('職員一覧と希望休一覧の両方のファイルをアップロードしてください。')
+                elif (year, month) != (result_year, result_month):
+                    st.warning(f'対象年月を {result_year}年{result_month}月 に戻してから再作成してください。')
+                else:
+                    try:
+                        incremental_params = collect_params()
+                        # 再作成も「勤務表を作成」と同じキューで実行し、同時に動く求解の数を制限する
+                        job_id = _get_job_queue().submit(incremental_params, label=f'{year}年{month}月（再作成）', task='incremental',
+                                                         task_args={'previous_schedule_df': schedule_df, 'changes': changes, 'mode': incremental_mode, 'radius': incremental_radius})
+                        st.session_state['solve_job'] = {'job_id': job_id, 'params': None,
+                                                         'result_params': dict(incremental_params, requests_df=apply_request_changes(incremental_params['requests_df'], changes))}
+                        st.query_params['job'] = job_id
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f'予期せぬエラーが発生しました: {e}')
+                        st.exception(e)
+
+        # --- 勤務表を手で修正して試算（ソルバーを使わずに、違反とペナルティをその場で計算する） ---
+        result_params = st.session_state.get('result_params')
+        if result_params is not None and (result_params['year'], result_params['month']) == (result_year, result_month):
+            with st.expander("▼ 勤務表を手で修正して試算"):
+                st.caption("セルを書き換えると、ハード制約の違反と各ルールのペナルティをすぐに計算し直します（休みは「-」、出勤は空欄）。")
+                edit_symbols = ['', '-', '○', '出', '×', '△', '有', '特', '夏', 'AM休', 'PM休', 'AM有', 'PM有']
+                edit_key = f"schedule_edit_{pd.util.hash_pandas_object(schedule_df, index=False).sum()}"
+                edited_df = st.data_editor(schedule_df.rename(columns=str), hide_index=True, key=edit_key, disabled=['職員番号', '職員名', '職種'],
+                                           column_config={str(d): st.column_config.SelectboxColumn(options=edit_symbols, width='small') for d in range(1, num_days + 1)})
+                edited_df = edited_df.rename(columns=lambda col: int(col) if col.isdigit() else col)
+                baseline = evaluate_schedule(schedule_df, result_params); evaluation = evaluate_schedule(edited_df, result_params)
+                num_edited = int((edited_df[list(range(1, num_days + 1))].to_numpy() != schedule_df[list(range(1, num_days + 1))].to_numpy()).sum())
+                eval_cols = st.columns(3)
+                eval_cols[0].metric("ペナルティ合計", evaluation['objective'], delta=evaluation['objective'] - baseline['objective'], delta_color='inverse')
+                eval_cols[1].metric("ハード制約の違反", len(evaluation['hard_violations']), delta=len(evaluation['hard_violations']) - len(baseline['hard_violations']), delta_color='inverse')
+                eval_cols[2].metric("書き換えたセル", num_edited)
+                if not evaluation['feasible']:
+                    st.error("ハード制約を満たしていません。")
+                    st.dataframe(evaluation['hard_violations'][['rule', 'detail']].rename(columns={'rule': 'ルール', 'detail': '内容'}), hide_index=True, use_container_width=True)
+                family_compare = baseline['families'][['family', 'penalty']].merge(evaluation['families'][['family', 'penalty', 'violations']], on='family', suffixes=('_before', '_after'))
+                st.dataframe(family_compare.rename(columns={'family': 'ルール', 'penalty_before': '修正前のペナルティ', 'penalty_after': '修正後のペナルティ', 'violations': '修正後の違反数'}), hide_index=True, use_container_width=True)
+                if st.button('この勤務表を採用', key='adopt_edit', disabled=not evaluation['feasible'] or num_edited == 0):
+                    adopted_message = f"手で修正した勤務表です（ペナルティ合計: **{evaluation['objective']}**）"
+                    st.session_state['solve_result'] = ((True, edited_df, evaluation['summary_df'], adopted_message, all_half_day_requests), result_year, result_month)
+                    edited_cells = np.argwhere(edited_df[list(range(1, num_days + 1))].to_numpy() != schedule_df[list(range(1, num_days + 1))].to_numpy())
+                    st.session_state['changed_cells'] = [(schedule_df['職員番号'].iloc[i], j + 1) for i, j in edited_cells.tolist()]
+                    st.rerun()
+
+# --- ペナルティ重みのスイープ（ルール検証モードの中に表示） ---
+with rule_expander:
+    st.markdown("---")
+    st.subheader("ペナルティ重みのスイープ")
+    st.caption("1行が1つのシナリオです。制約モデルは1回だけ組み立て、重みだけを変えて並列に求解し、各ソフト制約の違反数を比較します。")
+    sweep_scenarios = st.data_editor(pd.DataFrame([base_weights(params_ui)]), num_rows="dynamic", hide_index=True, key='sweep_scenarios')
+    sweep_cols = st.columns([1, 3])
+    with sweep_cols[0]: sweep_time_limit = st.number_input("1シナリオの制限時間（秒）", min_value=1, value=30, step=10, key='sweep_time_limit')
+    if sweep_cols[1].button('スイープを実行', key='run_sweep'):
+        if staff_file is not None and requests_file is not None:
+            try:
+                sweep_params = collect_params()
+                # シナリオごとに求解ジョブのキューへ投入し、同時に動く求解の数（REHA_SHIFT_MAX_SOLVES）の範囲で並列に解く
+                compiled = compile_sweep_model(sweep_params)
+                solver_params = sweep_solver_params(sweep_params, MAX_CONCURRENT_SOLVES, sweep_time_limit)
+                job_params = {'year': year, 'month': month, 'num_workers': sweep_params.get('num_workers')}
+                job_ids = [_get_job_queue().submit(job_params, label=f'{year}年{month}月（スイープ {i + 1}）', task='sweep_scenario',
+                                                   task_args={'compiled': compiled, 'scenario_id': i, 'weights': weights, 'solver_params': solver_params})
+                           for i, weights in enumerate(sweep_scenarios.dropna().to_dict('records'))]
+                st.session_state['sweep_job'] = {'job_ids': job_ids, 'compiled': {'family_terms': compiled['family_terms']}}
+                st.session_state.pop('sweep_result', None)
+            except Exception as e:
+                st.error(f'予期せぬエラーが発生しました: {e}')
+                st.exception(e)
+        else:
+            st.warning('職員一覧と希望休一覧の両方のファイルをアップロードしてください。')
+    if 'sweep_job' in st.session_state:
+        sweep_job = st.session_state['sweep_job']
+        sweep_statuses = [_get_job_queue().status(job_id) for job_id in sweep_job['job_ids']]
+        if all(status is None or status['status'] in JOB_STATUSES_FINISHED for status in sweep_statuses):
+            # 失敗したシナリオは、その旨を表に残して他のシナリオと並べる
+            rows = [_get_job_queue().result(job_id)['sweep_row'] if status is not None and status['status'] == 'done'
+                    else {'scenario': i, 'status': status['message'] if status else 'ジョブが見つかりませんでした', 'objective': None}
+                    for i, (job_id, status) in enumerate(zip(sweep_job['job_ids'], sweep_statuses))]
+            st.session_state['sweep_result'] = sweep_result_frame(rows, sweep_job['compiled'])
+            del st.session_state['sweep_job']
+        else:
+            _sweep_job_panel(sweep_job['job_ids'])
+    if 'sweep_result' in st.session_state:
+        sweep_result = st.session_state['sweep_result']
+        st.dataframe(sweep_result.style.apply(lambda row: ['background-color: #f0fff0' if row['非劣解'] else '' for _ in row], axis=1), hide_index=True)
+        st.caption("緑の行は、どの違反数でも他のシナリオに劣らないシナリオ（非劣解）です。")
+
+# --- 求解レポート（ルール検証モードの中に表示） ---
+if st.session_state.get('solve_report'):
+    solve_report = st.session_state['solve_report']
+    with rule_expander:
+        st.markdown("---")
+        st.subheader("求解レポート")
+        solver_stats = solve_report['solver']
+        report_cols = st.columns(5)
+        report_cols[0].metric("ステータス", solver_stats['status'])
+        report_cols[1].metric("ペナルティ合計", '-' if solver_stats['objective'] is None else round(solver_stats['objective']))
+        report_cols[2].metric("下界", '-' if solver_stats['best_bound'] is None else round(solver_stats['best_bound']))
+        report_cols[3].metric("求解時間（秒）", f"{solver_stats['wall_time']:.1f}")
+        report_cols[4].metric("変数 / 制約", f"{solve_report['model']['variables']} / {solve_report['model']['constraints']}")
+        st.caption(f"探索スレッド数 {solver_stats['num_workers']} / 競合 {solver_stats['conflicts']} / 分岐 {solver_stats['branches']} / モデル構築 {solve_report['model']['build_time']:.2f}秒")
+        family_df = pd.DataFrame(solve_report['families']).rename(columns={'family': 'ルール', 'build_time': '構築時間（秒）', 'variables': '変数', 'constraints': '制約', 'penalty': 'ペナルティ', 'violations': '違反数'})
+        st.dataframe(family_df, hide_index=True, use_container_width=True)
+        if solve_report['objective_history']:
+            history_df = pd.DataFrame(solve_report['objective_history']).rename(columns={'objective': 'ペナルティ合計', 'bound': '下界'}).set_index('wall_time')
+            st.markdown("###### 改善解の推移（横軸: 経過秒）")
+            st.line_chart(history_df)
+
 st.markdown("---")
 st.markdown(f"<div style='text-align: right; color: grey;'>{APP_CREDIT} | Version: {APP_VERSION}</div>", unsafe_allow_html=True)
\ No newline at end of file
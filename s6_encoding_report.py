@@ -0,0 +1,71 @@
+import argparse
+import json
+import time
+
+from ortools.sat.python import cp_model
+
+from shift_solver import read_staff_csv, read_requests_csv, fill_missing_staff_names, build_params, build_shift_model, run_solver
+
+# S6（職種別 業務負荷平準化）の定式化の比較レポート
+#
+# 使い方:
+#   python s6_encoding_report.py --staff staff.csv --requests requests.csv --month 2025-04 [--params params.json] [--time-limit 60]
+#
+# 従来の定式化 (legacy) と中間変数を使わない定式化 (compact) で同じ入力のモデルを組み立て、
+# モデルの大きさ（変数・制約数）と求解結果（最適性を証明するまでの時間）を並べて表示する。
+
+S6_ENCODINGS = ['legacy', 'compact']
+
+def measure_s6_encoding(params, encoding, time_limit=60.0):
+    params = dict(params, s6_encoding=encoding, time_limit=time_limit)
+    started = time.perf_counter()
+    model, _ = build_shift_model(params)
+    build_time = time.perf_counter() - started
+    proto = model.Proto()
+    solver, status = run_solver(model, params)
+    solved = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+    return {
+        'encoding': encoding, 'variables': len(proto.variables), 'constraints': len(proto.constraints),
+        'build_time': build_time, 'status': solver.StatusName(status), 'wall_time': solver.WallTime(),
+        'time_to_optimal': solver.WallTime() if status == cp_model.OPTIMAL else None,
+        'objective': solver.ObjectiveValue() if solved else None, 'best_bound': solver.BestObjectiveBound() if solved else None,
+    }
+
+def compare_s6_encodings(params, time_limit=60.0):
+    return [measure_s6_encoding(params, encoding, time_limit) for encoding in S6_ENCODINGS]
+
+def _format_row(row):
+    time_to_optimal = f"{row['time_to_optimal']:.2f}s" if row['time_to_optimal'] is not None else '未証明'
+    objective = f"{row['objective']:.0f}" if row['objective'] is not None else '-'
+    bound = f"{row['best_bound']:.0f}" if row['best_bound'] is not None else '-'
+    return (f"{row['encoding']:<8} 変数 {row['variables']:>7}  制約 {row['constraints']:>7}  構築 {row['build_time']:.2f}s  "
+            f"{row['status']:<10} 目的関数 {objective:>8}  下界 {bound:>8}  最適性証明 {time_to_optimal}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='S6の定式化ごとのモデル規模と求解時間を比較します。')
+    parser.add_argument('--staff', required=True, help='職員一覧CSV')
+    parser.add_argument('--requests', required=True, help='希望休一覧CSV')
+    parser.add_argument('--month', required=True, help='対象年月 (例: 2025-04)')
+    parser.add_argument('--params', help='パラメータファイル(JSON)')
+    parser.add_argument('--time-limit', type=float, default=60.0, help='1回の求解の制限時間（秒）')
+    parser.add_argument('--json', help='結果をJSONで書き出すファイル')
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    if args.params:
+        with open(args.params, encoding='utf-8') as f: overrides = json.load(f)
+    year, month = (int(x) for x in args.month.split('-'))
+    staff_df = read_staff_csv(args.staff); requests_df = read_requests_csv(args.requests)
+    fill_missing_staff_names(staff_df)
+    event_units = overrides.pop('event_units', None)
+    params = build_params(staff_df, requests_df, year, month, event_units, **overrides)
+
+    rows = compare_s6_encodings(params, args.time_limit)
+    print(f"{year}年{month}月 職員 {len(staff_df)}名")
+    for row in rows: print(_format_row(row))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f: json.dump(rows, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
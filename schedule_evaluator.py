@@ -0,0 +1,162 @@
+import calendar
+
+import numpy as np
+import pandas as pd
+
+from shift_solver import (CONSTRAINT_FAMILIES, WORK_SYMBOLS, parse_requests, month_weeks, s6_unit_targets,
+                          describe_hard_constraint, _create_summary)
+
+# 勤務表の評価（ソルバーを使わない）
+# schedule_df と同じ形の勤務表と、求解と同じ params から、H1〜H5 の違反と S0〜S6 の各ペナルティ項を
+# CP モデル（build_shift_model）と同じ定義で NumPy だけで計算し、日別サマリーも作り直す。
+# 画面上で勤務表を手で直したときの試算や、ソルバーの出力の検算に使う。
+
+def _schedule_matrix(schedule_df, days):
+    schedule_df = schedule_df.rename(columns=lambda col: int(col) if str(col).isdigit() else col)
+    return schedule_df[days].isin(WORK_SYMBOLS).to_numpy().astype(np.int64)
+
+def evaluate_schedule(schedule_df, params):
+    year, month = params['year'], params['month']
+    num_days = calendar.monthrange(year, month)[1]; days = list(range(1, num_days + 1))
+    sundays = [d for d in days if calendar.weekday(year, month, d) == 6]; weekdays = [d for d in days if d not in sundays]
+    sunday_cols = np.array([d - 1 for d in sundays], dtype=np.intp)
+    staff = schedule_df['職員番号'].astype(str).tolist()
+    staff_info = params['staff_df'].set_index('職員番号').to_dict('index')
+    requests = parse_requests(params['requests_df'], staff, days)
+    work = _schedule_matrix(schedule_df, days)
+
+    infos = [staff_info[s] for s in staff]
+    job = np.array([info['職種'] for info in infos], dtype=object)
+    role = np.array([info.get('役割1') for info in infos], dtype=object)
+    is_manager = np.array([pd.notna(info['役職']) for info in infos], dtype=bool)
+    pt, ot, st = job == '理学療法士', job == '作業療法士', job == '言語聴覚士'
+    kaifukuki_pt, kaifukuki_ot = (role == '回復期専従') & pt, (role == '回復期専従') & ot
+    gairai = role == '外来PT'; sunday_off = gairai | (role == '地域包括専従')
+    context = {'request_arrays': requests, 'staff_info': staff_info, 'h5_window_sundays': params.get('h5_window_sundays', 4)}
+
+    hard = []  # (ルール, 職員番号, 日)
+    terms = {}  # ファミリー -> [(職員番号, 日, 値, 重み)]
+
+    def add_terms(family, weight, values, staff_ids=None, day_list=None):
+        values = np.asarray(values)
+        entries = terms.setdefault(family, [])
+        for k, value in enumerate(values.tolist()):
+            entries.append((staff_ids[k] if staff_ids is not None else None, day_list[k] if day_list is not None else None, value, weight))
+
+    # --- ハード制約 ---
+    if params['h1_on']:
+        full_kokyu = (1 - work).sum(axis=1) - requests.leave_counts
+        violated = (full_kokyu < 0) | (full_kokyu > num_days) | (2 * full_kokyu + requests.half_kokyu_counts != 18)
+        hard += [('H1', staff[i], None) for i in np.flatnonzero(violated).tolist()]
+    if params['h2_on']:
+        violated = (requests.off_mask & (work == 1)) | (requests.on_mask & (work == 0))
+        hard += [('H2', s, d) for s, d in requests.cells(violated)]
+    if params['h3_on']:
+        hard += [('H3', None, days[j]) for j in np.flatnonzero(work[is_manager].sum(axis=0) < 1).tolist()]
+    if params['h4_on']:
+        rows, cols = np.nonzero(work[np.ix_(sunday_off, sunday_cols)])
+        off_staff = np.flatnonzero(sunday_off)
+        hard += [('H4', staff[off_staff[i]], sundays[j]) for i, j in zip(rows.tolist(), cols.tolist())]
+    carry_in = params.get('carry_in') or {}
+    if params['h5_on']:
+        hard += [('H5', staff[i], None) for i in np.flatnonzero(work[:, sunday_cols].sum(axis=1) > 2).tolist()]
+        window = context['h5_window_sundays']
+        staff_index = {s: i for i, s in enumerate(staff)}
+        for s, history in carry_in.get('sundays_worked', {}).items():
+            if s not in staff_index: continue
+            history = list(history)[-(window - 1):]
+            for start in range(len(history)):
+                current = sundays[:window - (len(history) - start)]
+                if current and sum(history[start:]) + int(work[staff_index[s], [d - 1 for d in current]].sum()) > 2: hard.append(('H5', s, current[-1]))
+    if params['s5_on']:
+        hard += [('S5', None, days[j]) for j in np.flatnonzero(work[kaifukuki_pt | kaifukuki_ot].sum(axis=0) < 1).tolist()]
+    fixed_values = params.get('fixed_values') or {}
+    staff_pos = {s: i for i, s in enumerate(staff)}
+    for (s, d), value in fixed_values.items():
+        if s in staff_pos and work[staff_pos[s], d - 1] != value: hard.append(('固定', s, d))
+
+    # --- ソフト制約（CP モデルのペナルティ項と同じ単位で計算する） ---
+    if params['s4_on']:
+        rows, cols = np.nonzero(requests.tri_mask)
+        add_terms('S4', params['s4_penalty'], work[rows, cols], [staff[i] for i in rows.tolist()], [days[j] for j in cols.tolist()])
+
+    if params['s0_on'] or params['s2_on']:
+        weeks = month_weeks(year, month)
+        carry_week_days = carry_in.get('week_days', 0)
+        carry_week = bool(carry_week_days) and len(weeks[0]) < 7 and carry_week_days + len(weeks[0]) == 7
+        for w_idx, week in enumerate(weeks):
+            cols = slice(week[0] - 1, week[-1])
+            full_requests = requests.full_off_mask[:, cols].sum(axis=1)
+            holiday_value = 2 * (1 - work[:, cols]).sum(axis=1) + (work[:, cols] * requests.half_mask[:, cols]).sum(axis=1)
+            carried = np.array([carry_week and w_idx == 0 and s in carry_in['week_holiday_value'] for s in staff], dtype=bool)
+            if carried.any():
+                full_requests = full_requests + np.array([carry_in['week_full_requests'].get(s, 0) if c else 0 for s, c in zip(staff, carried)])
+                holiday_value = holiday_value + np.array([carry_in['week_holiday_value'][s] if c else 0 for s, c in zip(staff, carried)])
+            full_week = carried | (len(week) == 7)
+            counted = full_requests < 3
+            for family, on, selected, threshold in [('S0', params['s0_on'], counted & full_week, 3), ('S2', params['s2_on'], counted & ~full_week, 1)]:
+                if not on: continue
+                idx = np.flatnonzero(selected)
+                add_terms(family, params[f'{family.lower()}_penalty'], (holiday_value[idx] < threshold).astype(np.int64), [staff[i] for i in idx.tolist()], [week[0]] * len(idx))
+
+    if any([params['s1a_on'], params['s1b_on'], params['s1c_on']]):
+        pt_on, ot_on, st_on = (work[np.ix_(mask, sunday_cols)].sum(axis=0) for mask in (pt, ot, st))
+        if params['s1a_on']:
+            add_terms('S1a', params['s1a_penalty'], np.abs(pt_on + ot_on - (params['target_pt'] + params['target_ot'])), day_list=sundays)
+        if params['s1b_on']:
+            pt_penalty = np.maximum(0, np.abs(pt_on - params['target_pt']) - params['tolerance'])
+            ot_penalty = np.maximum(0, np.abs(ot_on - params['target_ot']) - params['tolerance'])
+            # モデルと同じく、日曜ごとに PT・OT の順で項を並べる
+            add_terms('S1b', params['s1b_penalty'], np.stack([pt_penalty, ot_penalty], axis=1).ravel(), day_list=[d for d in sundays for _ in range(2)])
+        if params['s1c_on']:
+            add_terms('S1c', params['s1c_penalty'], np.abs(st_on - params['target_st']), day_list=sundays)
+    if params['s3_on']:
+        add_terms('S3', params['s3_penalty'], np.maximum(0, (1 - work[gairai]).sum(axis=0) - 1), day_list=days)
+    if params['s5_on']:
+        pt_absent = (work[kaifukuki_pt].sum(axis=0) == 0).astype(np.int64); ot_absent = (work[kaifukuki_ot].sum(axis=0) == 0).astype(np.int64)
+        add_terms('S5', params['s5_penalty'], np.stack([pt_absent, ot_absent], axis=1).ravel(), day_list=[d for d in days for _ in range(2)])
+
+    if params['s6_on']:
+        unit_penalty_weight = params.get('s6_penalty_heavy', 4) if params.get('high_flat_penalty') else params.get('s6_penalty', 2)
+        event_units = params['event_units']
+        job_types = {'PT': [s for s, m in zip(staff, pt) if m], 'OT': [s for s, m in zip(staff, ot) if m], 'ST': [s for s, m in zip(staff, st) if m]}
+        avg_residual_units_by_job, ratios = s6_unit_targets(staff_info, job_types, requests, weekdays, num_days, event_units)
+        # 半日勤務の日は単位数の半分（切り捨て）を提供する
+        base_units = np.array([int(info['1日の単位数']) for info in infos], dtype=np.int64)
+        half_units = np.array([int(unit * 0.5) for unit in base_units.tolist()], dtype=np.int64)
+        day_units = np.where(requests.half_mask, half_units[:, None], base_units[:, None]) * work
+        weekday_cols = [d - 1 for d in weekdays]
+        for job_key, mask in [('PT', pt), ('OT', ot), ('ST', st)]:
+            if not mask.any(): continue
+            ratio = ratios.get(job_key, 0)
+            targets = np.array([round(event_units[job_key.lower()].get(d, 0) + (event_units['all'].get(d, 0) * ratio)) + round(avg_residual_units_by_job.get(job_key, 0)) for d in weekdays], dtype=np.int64)
+            add_terms('S6', unit_penalty_weight, np.abs(day_units[mask][:, weekday_cols].sum(axis=0) - targets), day_list=weekdays)
+
+    if params.get('reference_values'):
+        changed = [(s, d, int(work[staff_pos[s], d - 1] != value)) for (s, d), value in params['reference_values'].items()
+                   if s in staff_pos and (s, d) not in fixed_values]
+        add_terms('変更', params.get('change_penalty', 30), [c for _, _, c in changed], [s for s, _, _ in changed], [d for _, d, _ in changed])
+
+    # --- 集計 ---
+    families = []
+    soft_rows = []
+    for family in CONSTRAINT_FAMILIES:
+        if family not in terms: continue
+        entries = terms[family]
+        families.append({'family': family, 'penalty': int(sum(value * weight for _, _, value, weight in entries)),
+                         'violations': sum(1 for _, _, value, _ in entries if value != 0)})
+        soft_rows += [{'family': family, 'staff': s, 'staff_name': staff_info[s]['職員名'] if s is not None else None, 'day': d, 'value': int(value), 'penalty': int(value * weight)}
+                      for s, d, value, weight in entries if value != 0]
+    hard_rows = [{'rule': rule, 'staff': s, 'staff_name': staff_info[s]['職員名'] if s is not None else None, 'day': d,
+                  'detail': describe_hard_constraint(context, rule, s, d) if rule != '固定' else f"{staff_info[s]['職員名']}: {d}日は固定されたセル"}
+                 for rule, s, d in hard]
+
+    all_half_day_requests = requests.half_day_sets()
+    summary_df = _create_summary(schedule_df.copy(), staff_info, year, month, params['event_units'], all_half_day_requests)
+    return {
+        'feasible': not hard_rows, 'objective': sum(row['penalty'] for row in families),
+        'families': pd.DataFrame(families, columns=['family', 'penalty', 'violations']),
+        'hard_violations': pd.DataFrame(hard_rows, columns=['rule', 'staff', 'staff_name', 'day', 'detail']),
+        'soft_terms': pd.DataFrame(soft_rows, columns=['family', 'staff', 'staff_name', 'day', 'value', 'penalty']),
+        'summary_df': summary_df,
+    }
@@ -0,0 +1,700 @@
+import pandas as pd
+import numpy as np
+from ortools.sat.python import cp_model
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+import calendar
+import io
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+# 勤務表作成のソルバー本体。Streamlit に依存しないため、UI・バッチ処理の双方から import して使う。
+
+# --- 既定パラメータ（UIの初期値と同じ） ---
+DEFAULT_PARAMS = {
+    'h1_on': True, 'h2_on': True, 'h3_on': True, 'h4_on': True, 'h5_on': True,
+    's0_on': True, 's0_penalty': 200, 's2_on': True, 's2_penalty': 25,
+    's3_on': True, 's3_penalty': 10, 's4_on': True, 's4_penalty': 8,
+    's5_on': True, 's5_penalty': 5, 's6_on': True, 's6_penalty': 2, 's6_penalty_heavy': 4, 'high_flat_penalty': False,
+    's1a_on': True, 's1a_penalty': 50, 's1b_on': True, 's1b_penalty': 40, 's1c_on': True, 's1c_penalty': 60,
+    's6_encoding': 'compact', 'change_penalty': 30, 'symmetry_breaking': False,
+    'target_pt': 10, 'target_ot': 5, 'target_st': 3, 'tolerance': 1,
+}
+REQUIRED_STAFF_COLS = ['職員番号', '職種', '1日の単位数']
+
+# --- ヘルパー関数: 入力データの読み込みと検証 ---
+def read_staff_csv(source):
+    return pd.read_csv(source, dtype={'職員番号': str})
+
+def read_requests_csv(source):
+    return pd.read_csv(source, dtype={'職員番号': str})
+
+def check_input_columns(staff_df, requests_df):
+    errors = []
+    missing_cols = [col for col in REQUIRED_STAFF_COLS if col not in staff_df.columns]
+    if missing_cols:
+        errors.append(f"エラー: 職員一覧CSVの必須列が不足しています。以下の列を追加してください: **{', '.join(missing_cols)}**")
+    if '職員番号' not in requests_df.columns:
+        errors.append(f"エラー: 希望休一覧CSVに必須列 **'職員番号'** がありません。")
+    return errors
+
+def fill_missing_staff_names(staff_df):
+    # 「職員名」列がない場合は仮の職員名を生成する（生成した場合は True を返す）
+    if '職員名' in staff_df.columns: return False
+    staff_df['職員名'] = staff_df['職種'] + " " + staff_df['職員番号'].astype(str)
+    return True
+
+def normalize_event_units(event_units):
+    # JSONなどから読み込んだ場合、日付キーが文字列になるため int に揃える
+    event_units = event_units or {}
+    return {key: {int(d): v for d, v in event_units.get(key, {}).items()} for key in ['all', 'pt', 'ot', 'st']}
+
+def build_params(staff_df, requests_df, year, month, event_units=None, **overrides):
+    params = dict(DEFAULT_PARAMS)
+    params.update(overrides)
+    params['staff_df'] = staff_df; params['requests_df'] = requests_df
+    params['year'] = year; params['month'] = month
+    params['event_units'] = normalize_event_units(event_units)
+    return params
+
+# --- 希望休の読み込み ---
+# 希望休は 職員 × 日 の整数コード行列として一度だけ取り込み、各制約ブロックはそのマスクと集計値を使い回す
+REQUEST_TYPES = ['×', '△', '○', '有', '特', '夏', 'AM有', 'PM有', 'AM休', 'PM休']
+REQUEST_CODES = {r: code for code, r in enumerate(REQUEST_TYPES, start=1)}  # 0 は希望なし
+OFF_REQUESTS = ['×', '有', '特', '夏']
+ON_REQUESTS = ['○', 'AM有', 'PM有', 'AM休', 'PM休']
+LEAVE_REQUESTS = ['有', '特', '夏']
+HALF_DAY_REQUESTS = ['AM有', 'PM有', 'AM休', 'PM休']
+HALF_KOKYU_REQUESTS = ['AM休', 'PM休']
+FULL_DAY_OFF_REQUESTS = ['×', '有', '特', '夏', '△']
+
+@dataclass
+class RequestArrays:
+    staff: list
+    days: list
+    codes: np.ndarray  # shape = (職員数, 日数), dtype = int8
+    staff_index: dict = field(init=False)
+
+    def __post_init__(self):
+        self.staff_index = {s: i for i, s in enumerate(self.staff)}
+        self.off_mask = self.mask(OFF_REQUESTS); self.on_mask = self.mask(ON_REQUESTS)
+        self.half_mask = self.mask(HALF_DAY_REQUESTS); self.tri_mask = self.mask(['△'])
+        self.full_off_mask = self.mask(FULL_DAY_OFF_REQUESTS)
+        self.leave_counts = self.mask(LEAVE_REQUESTS).sum(axis=1)
+        self.half_kokyu_counts = self.mask(HALF_KOKYU_REQUESTS).sum(axis=1)
+
+    def mask(self, request_types):
+        return np.isin(self.codes, [REQUEST_CODES[r] for r in request_types])
+
+    def cells(self, mask):
+        # マスクが立っている (職員番号, 日) の組を列挙する
+        rows, cols = np.nonzero(mask)
+        return [(self.staff[i], self.days[j]) for i, j in zip(rows.tolist(), cols.tolist())]
+
+    def half_day_sets(self):
+        return {s: {self.days[j] for j in np.flatnonzero(self.half_mask[i]).tolist()} for i, s in enumerate(self.staff)}
+
+def parse_requests(requests_df, staff, days):
+    codes = np.zeros((len(staff), len(days)), dtype=np.int8)
+    day_columns = {str(d): j for j, d in enumerate(days) if str(d) in requests_df.columns}
+    if day_columns and len(requests_df):
+        staff_index = {s: i for i, s in enumerate(staff)}
+        long_df = requests_df[['職員番号'] + list(day_columns)].melt(id_vars='職員番号', var_name='day', value_name='request')
+        long_df = long_df[long_df['request'].isin(REQUEST_TYPES) & long_df['職員番号'].isin(staff_index)]
+        # 同じ職員の行が複数ある場合は、後の行の希望で上書きする
+        long_df = long_df.drop_duplicates(subset=['職員番号', 'day'], keep='last')
+        rows = long_df['職員番号'].map(staff_index).to_numpy(dtype=np.int64)
+        cols = long_df['day'].map(day_columns).to_numpy(dtype=np.int64)
+        codes[rows, cols] = long_df['request'].map(REQUEST_CODES).to_numpy(dtype=np.int8)
+    return RequestArrays(staff, days, codes)
+
+# --- ヘルパー関数: Excel出力 ---
+def export_excel(schedule_df, summary_df, target=None):
+    # target を省略した場合はメモリ上に書き出し、バイト列を返す
+    output = io.BytesIO() if target is None else target
+    write_rosters_excel(output, [(None, schedule_df, summary_df)])
+    return output.getvalue() if target is None else None
+
+_SHEET_NAME_INVALID = str.maketrans({c: '_' for c in '[]:*?/\\'})
+
+def _excel_value(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)): return None
+    return value.item() if isinstance(value, np.generic) else value
+
+def _write_sheet(workbook, title, df):
+    # 1行ずつ書き出す（書き込み専用のブックでは、書いた行はすぐにディスク上の一時ファイルへ出る）
+    sheet = workbook.create_sheet(title=title.translate(_SHEET_NAME_INVALID)[:31])
+    header_font = Font(bold=True)
+    header = []
+    for col in df.columns:
+        cell = WriteOnlyCell(sheet, value=_excel_value(col)); cell.font = header_font
+        header.append(cell)
+    sheet.append(header)
+    for row in df.itertuples(index=False, name=None): sheet.append([_excel_value(v) for v in row])
+
+def write_rosters_excel(target, rosters):
+    # 複数の勤務表（月・部署）を1つのブックに書き出す。rosters は (見出し, schedule_df, summary_df) の並びで、
+    # ジェネレーターを渡せば1件ずつ読み込み・書き出しできるため、全件をメモリに持たずに済む。
+    # 見出しが None の勤務表は「勤務表」「日別サマリー」、それ以外は「<見出し> 勤務表」などのシート名にする。
+    workbook = Workbook(write_only=True)
+    for label, schedule_df, summary_df in rosters:
+        prefix = f'{label} ' if label else ''
+        _write_sheet(workbook, f'{prefix}勤務表', schedule_df)
+        _write_sheet(workbook, f'{prefix}日別サマリー', summary_df)
+    workbook.save(target)
+
+# --- ヘルパー関数: サマリー作成 ---
+WORK_SYMBOLS = ['', '○', '出', 'AM休', 'PM休', 'AM有', 'PM有']
+WEEKDAY_NAMES = ['月','火','水','木','金','土','日']
+
+def _summary_value(total, has_half):
+    # 半日勤務者が含まれる日は 0.5 刻みの float、含まれない日は int（従来の集計と同じ型）
+    return float(total) if has_half else int(round(total))
+
+def _create_summary(schedule_df, staff_info_dict, year, month, event_units, all_half_day_requests):
+    num_days = calendar.monthrange(year, month)[1]; days = list(range(1, num_days + 1)); daily_summary = []
+    schedule_df.columns = [col if isinstance(col, str) else int(col) for col in schedule_df.columns]
+    staff_ids = schedule_df['職員番号'].tolist()
+
+    # 職員 × 日 の出勤行列と半日勤務行列
+    work = schedule_df[days].isin(WORK_SYMBOLS).to_numpy()
+    half = np.zeros(work.shape, dtype=bool)
+    for i, sid in enumerate(staff_ids):
+        half_days = [d - 1 for d in all_half_day_requests.get(sid, ()) if 1 <= d <= num_days]
+        half[i, half_days] = True
+    weight = np.where(half, 0.5, 1.0) * work
+    half_work = (half & work).astype(np.int64)
+
+    # 職員ごとの属性マスク
+    infos = [staff_info_dict[sid] for sid in staff_ids]
+    job = np.array([info['職種'] for info in infos], dtype=object)
+    role = np.array([info.get('役割1') for info in infos], dtype=object)
+    units = np.array([int(info['1日の単位数']) for info in infos], dtype=np.float64)
+    masks = {
+        '出勤者総数': np.ones(len(staff_ids), dtype=bool),
+        'PT': job == '理学療法士', 'OT': job == '作業療法士', 'ST': job == '言語聴覚士',
+        '役職者': np.array([pd.notna(info['役職']) for info in infos], dtype=bool),
+        '回復期': role == '回復期専従', '地域包括': role == '地域包括専従', '外来': role == '外来PT',
+    }
+    counts = {key: (mask.astype(np.float64) @ weight, mask.astype(np.int64) @ half_work) for key, mask in masks.items()}
+    unit_sums = {key: ((mask * units) @ weight, mask.astype(np.int64) @ half_work) for key, mask in [('PT', masks['PT']), ('OT', masks['OT']), ('ST', masks['ST'])]}
+
+    for j, d in enumerate(days):
+        day_info = {}
+        day_info['日'] = d; day_info['曜日'] = WEEKDAY_NAMES[calendar.weekday(year, month, d)]
+        for key, (totals, half_counts) in counts.items():
+            day_info[key] = _summary_value(totals[j], half_counts[j] > 0)
+        if calendar.weekday(year, month, d) != 6:
+            pt_units, ot_units, st_units = (_summary_value(unit_sums[key][0][j], unit_sums[key][1][j] > 0) for key in ['PT', 'OT', 'ST'])
+            day_info['PT単位数'] = pt_units; day_info['OT単位数'] = ot_units; day_info['ST単位数'] = st_units
+            day_info['PT+OT単位数'] = pt_units + ot_units
+            total_event_unit = event_units['all'].get(d, 0) + event_units['pt'].get(d, 0) + event_units['ot'].get(d, 0) + event_units['st'].get(d, 0)
+            day_info['特別業務単位数'] = total_event_unit
+        else:
+            day_info['PT単位数'] = '-'; day_info['OT単位数'] = '-'; day_info['ST単位数'] = '-';
+            day_info['PT+OT単位数'] = '-'; day_info['特別業務単位数'] = '-'
+        daily_summary.append(day_info)
+    return pd.DataFrame(daily_summary)
+
+# 勤務表の記号表: SCHEDULE_SYMBOLS[出勤(1)/休み(0), 希望コード] が勤務表のセルに書く記号
+#   休み: ×・△・有・特・夏 はその記号、それ以外は「-」
+#   出勤: ○ と半日の希望（AM休/PM休/AM有/PM有）はその記号、△ は「出」、それ以外は空欄
+SCHEDULE_SYMBOLS = np.array([
+    ['-'] + [r if r in ['×', '△', '有', '特', '夏'] else '-' for r in REQUEST_TYPES],
+    [''] + [r if r in ['○'] + HALF_DAY_REQUESTS else '出' if r == '△' else '' for r in REQUEST_TYPES],
+], dtype=object)
+
+def _create_schedule_df(shift_matrix, requests, staff_df):
+    # shift_matrix は 職員 × 日 の出勤(1)/休み(0) 行列。記号表を引くだけで全セルを一度に作る
+    schedule_df = pd.DataFrame(SCHEDULE_SYMBOLS[shift_matrix.astype(np.intp), requests.codes], columns=requests.days)
+    schedule_df.insert(0, '職員番号', requests.staff)
+    staff_map = staff_df.set_index('職員番号')
+    schedule_df.insert(1, '職員名', schedule_df['職員番号'].map(staff_map['職員名']))
+    schedule_df.insert(2, '職種', schedule_df['職員番号'].map(staff_map['職種']))
+    return schedule_df
+
+# --- モデル構築の計測 ---
+# 制約ファミリー（レポートでの表示順）。「勤務変数」は職員×日の shifts 変数そのもの
+# 「固定」「変更」は再作成（incremental_solve）で、前回の勤務表のセルを固定する制約と、前回から変えたセルへのペナルティ
+# 「対称性」は入れ替え可能な職員どうしの勤務パターンに順序を付ける制約
+CONSTRAINT_FAMILIES = ['勤務変数', 'H1', 'H2', 'H3', 'H4', 'H5', '対称性', 'S0', 'S1a', 'S1b', 'S1c', 'S2', 'S3', 'S4', 'S5', 'S6', '固定', '変更']
+
+class _ModelStats:
+    # 制約ファミリーごとに、構築にかかった時間と追加した変数・制約の数を集計する
+    def __init__(self, model):
+        self.model = model
+        self.families = {}
+
+    @contextmanager
+    def family(self, name):
+        proto = self.model.Proto()
+        num_variables, num_constraints, started = len(proto.variables), len(proto.constraints), time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.families.setdefault(name, {'build_time': 0.0, 'variables': 0, 'constraints': 0})
+            entry['build_time'] += time.perf_counter() - started
+            entry['variables'] += len(proto.variables) - num_variables
+            entry['constraints'] += len(proto.constraints) - num_constraints
+
+class _HardConstraintGuards:
+    # 診断モードでは、ハード制約の各インスタンス（H1 は職員ごと、H2 は希望セルごと、H3 は日ごと…）に有効化リテラルを付け、
+    # どのインスタンスの組が矛盾しているかを割り当て（assumptions）から特定できるようにする。通常時は何も付けない
+    def __init__(self, model, enabled):
+        self.model = model
+        self.enabled = enabled
+        self.literals = []
+
+    def __call__(self, rule, staff=None, day=None):
+        if not self.enabled: return []
+        literal = self.model.NewBoolVar(f'guard_{rule}_{staff}_{day}')
+        self.literals.append((literal, rule, staff, day))
+        return [literal]
+
+def find_interchangeable_staff(staff, staff_info, requests, carry_in=None):
+    # 職種・役割1・1日の単位数が同じで、役職がなく、その月の希望が1件もない職員はどの制約から見ても区別できない。
+    # 前月から引き継いだ状態（日曜出勤の履歴・月初の週の休日の値と希望数）も同じであることを条件にする。
+    # そうした職員の同値類（2名以上）を返す
+    carry_in = carry_in or {}
+    classes = {}
+    for s_idx, s in enumerate(staff):
+        info = staff_info[s]
+        if pd.notna(info['役職']) or requests.codes[s_idx].any(): continue
+        role = info.get('役割1')
+        carried = (tuple(carry_in.get('sundays_worked', {}).get(s, ())), carry_in.get('week_holiday_value', {}).get(s), carry_in.get('week_full_requests', {}).get(s))
+        key = (info['職種'], role if pd.notna(role) else None, int(info['1日の単位数']), carried)
+        classes.setdefault(key, []).append(s)
+    return [members for members in classes.values() if len(members) >= 2]
+
+def _add_lex_order(model, upper, lower, name):
+    # upper の勤務ベクトルが lower 以上（辞書式）であることを表す。equal は「前日までが全て等しい」ことを表すリテラル
+    equal = None
+    for d, (x, y) in enumerate(zip(upper, lower)):
+        if equal is None: model.Add(x >= y)
+        else: model.Add(x >= y).OnlyEnforceIf(equal)
+        if d == len(upper) - 1: break
+        next_equal = model.NewBoolVar(f'lex_eq_{name}_{d}')
+        # 前日まで等しく、当日も等しい（x >= y のもとで x が 0 か y が 1）なら次も「等しい」
+        model.AddBoolOr([x, next_equal] + ([equal.Not()] if equal is not None else []))
+        model.AddBoolOr([y.Not(), next_equal] + ([equal.Not()] if equal is not None else []))
+        equal = next_equal
+
+def _add_penalty(penalties, family, weight, term):
+    # ペナルティは (重み, 項) の組としてファミリーごとに保持し、解の内訳を後から計算できるようにする
+    penalties.setdefault(family, []).append((weight, term))
+
+# --- 週の区切りと S6 の目標単位数（モデルと schedule_evaluator で共通） ---
+def month_weeks(year, month):
+    # 月の日を土曜日で区切った週の一覧（月初・月末の週は7日未満になりうる）
+    num_days = calendar.monthrange(year, month)[1]
+    weeks, current_week = [], []
+    for d in range(1, num_days + 1):
+        current_week.append(d)
+        if calendar.weekday(year, month, d) == 5 or d == num_days: weeks.append(current_week); current_week = []
+    return weeks
+
+def s6_unit_targets(staff_info, job_types, requests, weekdays, num_days, event_units):
+    # 職種ごとの平日1日あたりの平均残余単位数と、職種間の単位数の比率
+    total_weekday_units_by_job = {}
+    for job, members in job_types.items():
+        if not members:
+            total_weekday_units_by_job[job] = 0
+            continue
+        total_units = sum(int(staff_info[s]['1日の単位数']) * (len(weekdays) / num_days) * (num_days - 9 - int(requests.leave_counts[requests.staff_index[s]])) for s in members)
+        total_weekday_units_by_job[job] = total_units
+
+    total_all_jobs_units = sum(total_weekday_units_by_job.values())
+    ratios = {job: total_units / total_all_jobs_units if total_all_jobs_units > 0 else 0 for job, total_units in total_weekday_units_by_job.items()}
+
+    avg_residual_units_by_job = {}
+    total_event_units_all = sum(event_units['all'].values())
+
+    for job, members in job_types.items():
+        if not weekdays or not members:
+            avg_residual_units_by_job[job] = 0
+            continue
+        total_event_units_job = sum(event_units[job.lower()].values())
+        total_event_units_for_job = total_event_units_job + (total_event_units_all * ratios.get(job, 0))
+        avg_residual_units_by_job[job] = (total_weekday_units_by_job.get(job, 0) - total_event_units_for_job) / len(weekdays)
+    return avg_residual_units_by_job, ratios
+
+# --- モデル構築 ---
+def build_shift_model(params):
+    year, month = params['year'], params['month']
+    num_days = calendar.monthrange(year, month)[1]; days = list(range(1, num_days + 1)); staff = params['staff_df']['職員番号'].tolist()
+    staff_info = params['staff_df'].set_index('職員番号').to_dict('index')
+    params['staff_info'] = staff_info 
+    params['staff'] = staff 
+    sundays = [d for d in days if calendar.weekday(year, month, d) == 6]; weekdays = [d for d in days if d not in sundays]
+    params['sundays'] = sundays; params['weekdays'] = weekdays; params['days'] = days 
+    
+    managers = [s for s in staff if pd.notna(staff_info[s]['役職'])]; pt_staff = [s for s in staff if staff_info[s]['職種'] == '理学療法士']
+    ot_staff = [s for s in staff if staff_info[s]['職種'] == '作業療法士']; st_staff = [s for s in staff if staff_info[s]['職種'] == '言語聴覚士']
+    params['pt_staff'] = pt_staff; params['ot_staff'] = ot_staff; params['st_staff'] = st_staff 
+    
+    kaifukuki_staff = [s for s in staff if staff_info[s].get('役割1') == '回復期専従']; kaifukuki_pt = [s for s in kaifukuki_staff if staff_info[s]['職種'] == '理学療法士']
+    kaifukuki_ot = [s for s in kaifukuki_staff if staff_info[s]['職種'] == '作業療法士']; gairai_staff = [s for s in staff if staff_info[s].get('役割1') == '外来PT']
+    chiiki_staff = [s for s in staff if staff_info[s].get('役割1') == '地域包括専従']; sunday_off_staff = gairai_staff + chiiki_staff
+    params['kaifukuki_pt'] = kaifukuki_pt; params['kaifukuki_ot'] = kaifukuki_ot; params['gairai_staff'] = gairai_staff 
+    job_types = {'PT': pt_staff, 'OT': ot_staff, 'ST': st_staff}
+    params['job_types'] = job_types 
+    
+    requests = parse_requests(params['requests_df'], staff, days)
+    params['request_arrays'] = requests
+
+    model = cp_model.CpModel(); shifts = {}
+    stats = _ModelStats(model)
+    guard = _HardConstraintGuards(model, params.get('diagnose_hard_constraints', False))
+    # shift_index は shifts の変数番号を 職員 × 日 の行列に並べたもので、解の値を一括で取り出すのに使う
+    shift_index = np.empty((len(staff), num_days), dtype=np.int64)
+    with stats.family('勤務変数'):
+        for s_idx, s in enumerate(staff):
+            for d in days:
+                shifts[(s, d)] = model.NewBoolVar(f'shift_{s}_{d}'); shift_index[s_idx, d - 1] = shifts[(s, d)].Index()
+    params['shift_index'] = shift_index
+    # 前回の解（キャッシュなど）がある場合は初期解のヒントとして与える
+    for (s, d), value in (params.get('hint_values') or {}).items():
+        if (s, d) in shifts: model.AddHint(shifts[(s, d)], value)
+    fixed_values = params.get('fixed_values') or {}
+    if fixed_values:
+        with stats.family('固定'):
+            for (s, d), value in fixed_values.items():
+                if (s, d) in shifts: model.Add(shifts[(s, d)] == value)
+
+    if params['h1_on']:
+        with stats.family('H1'):
+            for s_idx, s in enumerate(staff):
+                num_leave = int(requests.leave_counts[s_idx])
+                num_half_kokyu = int(requests.half_kokyu_counts[s_idx])
+                
+                full_holidays_total = sum(1 - shifts[(s, d)] for d in days)
+                
+                full_holidays_kokyu = model.NewIntVar(0, num_days, f'full_kokyu_{s}')
+                h1_guard = guard('H1', s)
+                model.Add(full_holidays_kokyu == full_holidays_total - num_leave).OnlyEnforceIf(h1_guard)
+                
+                model.Add(2 * full_holidays_kokyu + num_half_kokyu == 18).OnlyEnforceIf(h1_guard)
+
+    if params['h2_on']:
+        with stats.family('H2'):
+            for s, d in requests.cells(requests.off_mask): model.Add(shifts[(s, d)] == 0).OnlyEnforceIf(guard('H2', s, d))
+            for s, d in requests.cells(requests.on_mask): model.Add(shifts[(s, d)] == 1).OnlyEnforceIf(guard('H2', s, d))
+
+    if params['h3_on']:
+        with stats.family('H3'):
+            for d in days: model.Add(sum(shifts[(s, d)] for s in managers) >= 1).OnlyEnforceIf(guard('H3', day=d))
+    if params['h4_on']:
+        with stats.family('H4'):
+            for s in sunday_off_staff:
+                for d in sundays: model.Add(shifts[(s, d)] == 0).OnlyEnforceIf(guard('H4', s, d))
+    carry_in = params.get('carry_in') or {}
+    if params['h5_on']:
+        with stats.family('H5'):
+            for s in staff: model.Add(sum(shifts[(s, d)] for d in sundays) <= 2).OnlyEnforceIf(guard('H5', s))
+            # 複数月の作成（horizon_solve）では、前月末の日曜出勤を引き継ぎ、月をまたぐ連続 window 回の日曜でも出勤を2回までにする
+            window = params.get('h5_window_sundays', 4)
+            for s, history in carry_in.get('sundays_worked', {}).items():
+                if s not in staff_info: continue
+                history = list(history)[-(window - 1):]
+                for start in range(len(history)):
+                    current = sundays[:window - (len(history) - start)]
+                    if current: model.Add(sum(history[start:]) + sum(shifts[(s, d)] for d in current) <= 2).OnlyEnforceIf(guard('H5', s, current[-1]))
+    
+    # 対称性の除去: 入れ替え可能な職員の勤務ベクトルに辞書式の順序を付け、同じ勤務表の並べ替えを探索しないようにする。
+    # 固定セルや前回からの変更ペナルティがある場合は職員が入れ替え可能でなくなるので付けない
+    params['symmetry_classes'] = []
+    if params.get('symmetry_breaking') and not params.get('fixed_values') and not params.get('reference_values') and not params.get('diagnose_hard_constraints'):
+        with stats.family('対称性'):
+            hint_values = params.get('hint_values') or {}
+            for members in find_interchangeable_staff(staff, staff_info, requests, carry_in):
+                # ヒントがあれば、ヒントの勤務表がこの順序を満たすように並べておく
+                members = sorted(members, key=lambda s: tuple(hint_values.get((s, d), 0) for d in days), reverse=True)
+                for upper, lower in zip(members, members[1:]):
+                    _add_lex_order(model, [shifts[(upper, d)] for d in days], [shifts[(lower, d)] for d in days], f'{upper}_{lower}')
+                params['symmetry_classes'].append(members)
+
+    penalties = {}
+    
+    if params['s4_on']:
+        with stats.family('S4'):
+            for s, d in requests.cells(requests.tri_mask):
+                _add_penalty(penalties, 'S4', params['s4_penalty'], shifts[(s, d)])
+
+    if params['s0_on'] or params['s2_on']:
+        weeks_in_month = month_weeks(year, month)
+        params['weeks_in_month'] = weeks_in_month
+        
+        week_full_requests = np.stack([requests.full_off_mask[:, week[0] - 1:week[-1]].sum(axis=1) for week in weeks_in_month], axis=1)
+        # 前月末の週の続き（複数月の作成）: 前月分の日数と合わせて7日になる月初の週は、前月分の休日を足して完全な週（S0）として扱う
+        carry_week_days = carry_in.get('week_days', 0)
+        carry_week = bool(carry_week_days) and len(weeks_in_month[0]) < 7 and carry_week_days + len(weeks_in_month[0]) == 7
+        for s_idx, s in enumerate(staff):
+            for w_idx, week in enumerate(weeks_in_month):
+                carried = carry_week and w_idx == 0 and s in carry_in['week_holiday_value']
+                full_week = len(week) == 7 or carried
+                if week_full_requests[s_idx, w_idx] + (carry_in['week_full_requests'].get(s, 0) if carried else 0) >= 3: continue
+                with stats.family('S0' if full_week else 'S2'):
+                    num_full_holidays_in_week = sum(1 - shifts[(s, d)] for d in week)
+                    
+                    num_half_holidays_in_week = sum(shifts[(s, d)] for d in week if requests.half_mask[s_idx, d - 1])
+
+                    total_holiday_value = model.NewIntVar(0, 28, f'thv_s{s_idx}_w{w_idx}')
+                    model.Add(total_holiday_value == 2 * num_full_holidays_in_week + num_half_holidays_in_week + (carry_in['week_holiday_value'][s] if carried else 0))
+
+                    if full_week and params['s0_on']:
+                        violation = model.NewBoolVar(f'f_w_v_s{s_idx}_w{w_idx}'); model.Add(total_holiday_value < 3).OnlyEnforceIf(violation); model.Add(total_holiday_value >= 3).OnlyEnforceIf(violation.Not()); _add_penalty(penalties, 'S0', params['s0_penalty'], violation)
+                    elif not full_week and params['s2_on']:
+                        violation = model.NewBoolVar(f'p_w_v_s{s_idx}_w{w_idx}'); model.Add(total_holiday_value < 1).OnlyEnforceIf(violation); model.Add(total_holiday_value >= 1).OnlyEnforceIf(violation.Not()); _add_penalty(penalties, 'S2', params['s2_penalty'], violation)
+    
+    if any([params['s1a_on'], params['s1b_on'], params['s1c_on']]):
+        for d in sundays:
+            pt_on_sunday = sum(shifts[(s, d)] for s in pt_staff); ot_on_sunday = sum(shifts[(s, d)] for s in ot_staff); st_on_sunday = sum(shifts[(s, d)] for s in st_staff)
+            if params['s1a_on']:
+                with stats.family('S1a'):
+                    total_pt_ot = pt_on_sunday + ot_on_sunday; total_diff = model.NewIntVar(-50, 50, f't_d_{d}'); model.Add(total_diff == total_pt_ot - (params['target_pt'] + params['target_ot'])); abs_total_diff = model.NewIntVar(0, 50, f'a_t_d_{d}'); model.AddAbsEquality(abs_total_diff, total_diff); _add_penalty(penalties, 'S1a', params['s1a_penalty'], abs_total_diff)
+            if params['s1b_on']:
+                with stats.family('S1b'):
+                    pt_diff = model.NewIntVar(-30, 30, f'p_d_{d}'); model.Add(pt_diff == pt_on_sunday - params['target_pt']); abs_pt_diff = model.NewIntVar(0, 30, f'a_p_d_{d}'); model.AddAbsEquality(abs_pt_diff, pt_diff); pt_penalty = model.NewIntVar(0, 30, f'p_p_{d}'); model.AddMaxEquality(pt_penalty, [abs_pt_diff - params['tolerance'], 0]); _add_penalty(penalties, 'S1b', params['s1b_penalty'], pt_penalty)
+                    ot_diff = model.NewIntVar(-30, 30, f'o_d_{d}'); model.Add(ot_diff == ot_on_sunday - params['target_ot']); abs_ot_diff = model.NewIntVar(0, 30, f'a_o_d_{d}'); model.AddAbsEquality(abs_ot_diff, ot_diff); ot_penalty = model.NewIntVar(0, 30, f'o_p_{d}'); model.AddMaxEquality(ot_penalty, [abs_ot_diff - params['tolerance'], 0]); _add_penalty(penalties, 'S1b', params['s1b_penalty'], ot_penalty)
+            if params['s1c_on']:
+                with stats.family('S1c'):
+                    st_diff = model.NewIntVar(-10, 10, f's_d_{d}'); model.Add(st_diff == st_on_sunday - params['target_st']); abs_st_diff = model.NewIntVar(0, 10, f'a_s_d_{d}'); model.AddAbsEquality(abs_st_diff, st_diff); _add_penalty(penalties, 'S1c', params['s1c_penalty'], abs_st_diff)
+    if params['s3_on']:
+        with stats.family('S3'):
+            for d in days:
+                num_gairai_off = sum(1 - shifts[(s, d)] for s in gairai_staff); penalty = model.NewIntVar(0, len(gairai_staff), f'g_p_{d}'); model.AddMaxEquality(penalty, [num_gairai_off - 1, 0]); _add_penalty(penalties, 'S3', params['s3_penalty'], penalty)
+    if params['s5_on']:
+        with stats.family('S5'):
+            for d in days:
+                kaifukuki_pt_on = sum(shifts[(s, d)] for s in kaifukuki_pt)
+                kaifukuki_ot_on = sum(shifts[(s, d)] for s in kaifukuki_ot)
+                model.Add(kaifukuki_pt_on + kaifukuki_ot_on >= 1).OnlyEnforceIf(guard('S5', day=d))
+                pt_present = model.NewBoolVar(f'k_p_p_{d}'); ot_present = model.NewBoolVar(f'k_o_p_{d}'); model.Add(kaifukuki_pt_on >= 1).OnlyEnforceIf(pt_present); model.Add(kaifukuki_pt_on == 0).OnlyEnforceIf(pt_present.Not()); model.Add(kaifukuki_ot_on >= 1).OnlyEnforceIf(ot_present); model.Add(kaifukuki_ot_on == 0).OnlyEnforceIf(ot_present.Not()); _add_penalty(penalties, 'S5', params['s5_penalty'], pt_present.Not()); _add_penalty(penalties, 'S5', params['s5_penalty'], ot_present.Not())
+    
+    if params['s6_on']:
+        with stats.family('S6'):
+            unit_penalty_weight = params.get('s6_penalty_heavy', 4) if params.get('high_flat_penalty') else params.get('s6_penalty', 2)
+            event_units = params['event_units']
+            avg_residual_units_by_job, ratios = s6_unit_targets(staff_info, job_types, requests, weekdays, num_days, event_units)
+            params['avg_residual_units_by_job'] = avg_residual_units_by_job
+            params['ratios'] = ratios
+
+            for job, members in job_types.items():
+                if not members: continue
+                avg_residual_units = avg_residual_units_by_job.get(job, 0)
+                ratio = ratios.get(job, 0)
+            
+                for d in weekdays:
+                    event_unit_for_day = event_units[job.lower()].get(d, 0) + (event_units['all'].get(d, 0) * ratio)
+                    if params.get('s6_encoding', 'compact') == 'legacy':
+                        provided_units_expr_list = []
+                        for s in members:
+                            unit = int(staff_info[s]['1日の単位数'])
+                            is_half = requests.half_mask[requests.staff_index[s], d - 1]
+                            constant_unit = int(unit * 0.5) if is_half else unit
+
+                            term = model.NewIntVar(0, constant_unit, f'p_u_s{s}_d{d}')
+                            model.Add(term == shifts[(s,d)] * constant_unit)
+                            provided_units_expr_list.append(term)
+                    
+                        provided_units_expr = sum(provided_units_expr_list)
+                    
+                        residual_units_expr = model.NewIntVar(-4000, 4000, f'r_{job}_{d}')
+                        model.Add(residual_units_expr == provided_units_expr - round(event_unit_for_day))
+                    
+                        diff_expr = model.NewIntVar(-4000, 4000, f'u_d_{job}_{d}')
+                        model.Add(diff_expr == residual_units_expr - round(avg_residual_units))
+                    
+                        abs_diff_expr = model.NewIntVar(0, 4000, f'a_u_d_{job}_{d}')
+                        model.AddAbsEquality(abs_diff_expr, diff_expr)
+                    else:
+                        # 提供単位数は shifts の一次式のまま扱い、中間変数を作らない。絶対値の変域はその日の単位数の合計から決める
+                        day_units = [int(int(staff_info[s]['1日の単位数']) * 0.5) if requests.half_mask[requests.staff_index[s], d - 1] else int(staff_info[s]['1日の単位数']) for s in members]
+                        target_units = round(event_unit_for_day) + round(avg_residual_units)
+                        diff_expr = cp_model.LinearExpr.WeightedSum([shifts[(s, d)] for s in members], day_units) - target_units
+                        diff_lb = sum(u for u in day_units if u < 0) - target_units; diff_ub = sum(u for u in day_units if u > 0) - target_units
+                        abs_diff_expr = model.NewIntVar(0, max(abs(diff_lb), abs(diff_ub)), f'a_u_d_{job}_{d}')
+                        model.AddAbsEquality(abs_diff_expr, diff_expr)
+                    _add_penalty(penalties, 'S6', unit_penalty_weight, abs_diff_expr)
+
+    if params.get('reference_values'):
+        with stats.family('変更'):
+            # 前回の勤務表と異なる値になったセルごとにペナルティ（固定したセルは変わらないので除く）
+            for (s, d), value in params['reference_values'].items():
+                if (s, d) not in shifts or (s, d) in fixed_values: continue
+                _add_penalty(penalties, '変更', params.get('change_penalty', 30), shifts[(s, d)] if value == 0 else shifts[(s, d)].Not())
+
+    model.Minimize(sum(weight * term for terms in penalties.values() for weight, term in terms))
+    params['penalty_terms'] = penalties; params['model_stats'] = stats.families; params['hard_constraint_guards'] = guard.literals
+    return model, shifts
+
+# --- ソルバーの設定と途中経過の通知 ---
+def configure_solver(solver, params):
+    time_limit = float(params.get('time_limit', 60.0))
+    solver.parameters.num_workers = int(params.get('num_workers') or os.cpu_count() or 1)
+    solver.parameters.random_seed = int(params.get('random_seed', 0))
+    if params.get('relative_gap_limit'): solver.parameters.relative_gap_limit = float(params['relative_gap_limit'])
+    if params.get('deterministic'):
+        # 決定的モード: 並列探索を交互実行にし、制限時間を決定的時間でも打ち切る。決定的時間は実時間より長くかかることが
+        # あるため、実時間の上限（wall_time_limit、既定は制限時間と同じ）も残す。実時間で先に止まった場合は結果を再現できない
+        solver.parameters.interleave_search = True
+        solver.parameters.max_deterministic_time = time_limit
+        solver.parameters.max_time_in_seconds = float(params.get('wall_time_limit') or time_limit)
+    else:
+        solver.parameters.max_time_in_seconds = time_limit
+    solver.parameters.log_search_progress = bool(params.get('solver_log'))
+
+class _SolutionProgress(cp_model.CpSolverSolutionCallback):
+    # 改善解が見つかるたびに（目的関数値, 下界, 経過時間）を記録し、on_progress があれば通知する
+    def __init__(self, on_progress=None):
+        super().__init__()
+        self.on_progress = on_progress
+        self.history = []
+
+    def on_solution_callback(self):
+        info = {'objective': self.ObjectiveValue(), 'bound': self.BestObjectiveBound(), 'wall_time': self.WallTime()}
+        self.history.append(info)
+        if self.on_progress: self.on_progress(info)
+
+def _stop_when_requested(solver, stop_event, finished):
+    # stop_event がセットされたら、その時点の最良解で探索を打ち切る
+    while not finished.is_set():
+        if stop_event.wait(0.2):
+            solver.StopSearch(); return
+
+def run_solver(model, params):
+    solver = cp_model.CpSolver(); configure_solver(solver, params)
+    progress = _SolutionProgress(params.get('on_progress'))
+    finished = threading.Event()
+    if params.get('stop_event') is not None:
+        threading.Thread(target=_stop_when_requested, args=(solver, params['stop_event'], finished), daemon=True).start()
+    try:
+        status = solver.Solve(model, progress)
+    finally:
+        finished.set()
+    params['solution_history'] = progress.history
+    return solver, status
+
+# --- 求解レポート ---
+def build_solve_report(params, model, solver, status, build_time):
+    # 制約ファミリーごとの規模・構築時間・ペナルティ内訳と、CP-SATの探索統計をまとめる
+    solved = status == cp_model.OPTIMAL or status == cp_model.FEASIBLE
+    model_stats = params.get('model_stats', {}); penalties = params.get('penalty_terms', {})
+    families = []
+    for name in CONSTRAINT_FAMILIES:
+        if name not in model_stats and name not in penalties: continue
+        row = {'family': name, 'build_time': 0.0, 'variables': 0, 'constraints': 0, 'penalty': None, 'violations': None}
+        row.update(model_stats.get(name, {}))
+        if name in penalties and solved:
+            values = [solver.Value(term) for _, term in penalties[name]]
+            row['penalty'] = sum(weight * value for (weight, _), value in zip(penalties[name], values))
+            row['violations'] = sum(1 for value in values if value != 0)
+        families.append(row)
+    proto = model.Proto()
+    return {
+        'families': families,
+        'model': {'variables': len(proto.variables), 'constraints': len(proto.constraints), 'build_time': build_time},
+        'solver': {
+            'status': solver.StatusName(status), 'objective': solver.ObjectiveValue() if solved else None,
+            'best_bound': solver.BestObjectiveBound() if solved else None, 'wall_time': solver.WallTime(), 'user_time': solver.UserTime(),
+            'conflicts': solver.NumConflicts(), 'branches': solver.NumBranches(), 'booleans': solver.NumBooleans(),
+            'num_workers': solver.parameters.num_workers,
+        },
+        'objective_history': params.get('solution_history', []),
+    }
+
+# --- 矛盾の診断 ---
+# 勤務表が作れないとき、ハード制約のうち同時には満たせないインスタンスの最小の組（職員・日付つき）を求める
+SOFT_RULES = ['s0', 's1a', 's1b', 's1c', 's2', 's3', 's4', 's6']  # S5 は「回復期PT・OTのどちらかが出勤」のハード部分を含むので残す
+
+def describe_hard_constraint(params, rule, s, d):
+    requests = params['request_arrays']
+    name = params['staff_info'][s]['職員名'] if s is not None else None
+    if rule == 'H1':
+        s_idx = requests.staff_index[s]
+        return f"{name}: 月間休日数（公休は半日単位で18、有休等 {int(requests.leave_counts[s_idx])}日、半日公休 {int(requests.half_kokyu_counts[s_idx])}回）"
+    if rule == 'H2':
+        return f"{name}: {d}日の希望「{REQUEST_TYPES[requests.codes[requests.staff_index[s], d - 1] - 1]}」"
+    if rule == 'H3': return f"{d}日: 役職者を1人以上配置"
+    if rule == 'H4': return f"{name}: {d}日（日曜）は出勤できない役割"
+    if rule == 'H5' and d is not None: return f"{name}: 前月から続く日曜（{d}日まで）の連続{params.get('h5_window_sundays', 4)}回のうち、出勤は2回まで"
+    if rule == 'H5': return f"{name}: 日曜出勤は月2回まで"
+    return f"{d}日: 回復期専従のPT・OTのどちらかを配置"
+
+def diagnose_infeasibility(params, time_limit=10.0):
+    diag_params = dict(params, diagnose_hard_constraints=True, hint_values=None, fixed_values=None, reference_values=None, **{f'{rule}_on': False for rule in SOFT_RULES})
+    model, _ = build_shift_model(diag_params)
+    model.ClearObjective()
+    guards = diag_params['hard_constraint_guards']
+    deadline = time.perf_counter() + time_limit
+
+    def is_infeasible(candidates):
+        model.ClearAssumptions(); model.AddAssumptions([literal for literal, *_ in candidates])
+        solver = cp_model.CpSolver()
+        # 矛盾の原因となる割り当ての抽出は単一ワーカーでのみ行われる
+        solver.parameters.num_workers = 1
+        solver.parameters.max_time_in_seconds = max(0.1, deadline - time.perf_counter())
+        status = solver.Solve(model)
+        return status == cp_model.INFEASIBLE, status, solver
+
+    infeasible, _, solver = is_infeasible(guards)
+    if not infeasible: return [], True
+    core = set(solver.SufficientAssumptionsForInfeasibility())
+    conflict = [g for g in guards if g[0].Index() in core]
+    # 1つずつ外してみて、外しても矛盾が残るものは取り除く（残ったものはどれを外しても解ける＝極小）
+    # 制限時間で打ち切った場合や、外して解けるかを時間内に確かめられなかった場合は極小とは限らない
+    i, minimal = 0, True
+    while i < len(conflict):
+        if time.perf_counter() >= deadline: minimal = False; break
+        candidates = conflict[:i] + conflict[i + 1:]
+        infeasible, status, _ = is_infeasible(candidates)
+        if infeasible: conflict = candidates
+        else: minimal = minimal and status != cp_model.UNKNOWN; i += 1
+    return [{'rule': rule, 'staff': s, 'staff_name': diag_params['staff_info'][s]['職員名'] if s is not None else None, 'day': d,
+             'detail': describe_hard_constraint(diag_params, rule, s, d)} for _, rule, s, d in conflict], minimal
+
+# --- メインのソルバー関数 ---
+def solve_shift_model(params):
+    build_started = time.perf_counter()
+    model, shifts = build_shift_model(params)
+    build_time = time.perf_counter() - build_started
+    staff, days = params['staff'], params['days']
+    solver, status = run_solver(model, params)
+    solved = status == cp_model.OPTIMAL or status == cp_model.FEASIBLE
+    report = build_solve_report(params, model, solver, status, build_time)
+    params['solve_report'] = report
+    # 計測用の統計（ベンチマークなどで参照する）
+    params['solve_stats'] = {
+        'variables': report['model']['variables'], 'constraints': report['model']['constraints'],
+        'build_time': build_time, 'solve_time': report['solver']['wall_time'], 'status': report['solver']['status'],
+        'objective': report['solver']['objective'], 'best_bound': report['solver']['best_bound'],
+    }
+    
+    if solved:
+        # 解の値は変数番号で一括して取り出す。shifts_values は (職員番号, 日) をキーにした同じ値（キャッシュ・再作成などで使う）
+        shift_matrix = np.asarray(solver.ResponseProto().solution, dtype=np.int64)[params['shift_index']].astype(np.int8)
+        params['shift_matrix'] = shift_matrix
+        params['shifts_values'] = dict(zip(itertools.product(staff, days), shift_matrix.ravel().tolist()))
+        all_half_day_requests = params['request_arrays'].half_day_sets()
+        schedule_df = _create_schedule_df(shift_matrix, params['request_arrays'], params['staff_df'])
+        summary_df = _create_summary(schedule_df, params['staff_info'], params['year'], params['month'], params['event_units'], all_half_day_requests)
+        message = f"求解ステータス: **{solver.StatusName(status)}** (ペナルティ合計: **{round(solver.ObjectiveValue())}**)"
+        if params.get('deterministic') and status == cp_model.FEASIBLE and solver.ResponseProto().deterministic_time < solver.parameters.max_deterministic_time:
+            message += "（決定的時間の上限より先に実時間の制限時間で打ち切ったため、同じ入力でも結果が変わることがあります）"
+        
+        return True, schedule_df, summary_df, message, all_half_day_requests
+    else:
+        message = f"致命的なエラー: ハード制約が矛盾しているため、勤務表を作成できませんでした。({solver.StatusName(status)})"
+        # diagnose_infeasible=False なら診断を省く（解けなければ別の方法で解き直す呼び出し側のため）
+        if status == cp_model.INFEASIBLE and params.get('diagnose_infeasible', True):
+            conflicts, minimal = diagnose_infeasibility(params)
+            params['conflicts'] = conflicts
+            params['conflicts_minimal'] = minimal
+            note = "どれか1つを緩めると解消します" if minimal else "時間内に最小の組み合わせまで絞り込めなかったため、緩める必要のない条件も含まれることがあります"
+            if conflicts: message += f"\n\n次の条件は同時には満たせません（{note}）:\n" + "\n".join(f"- [{c['rule']}] {c['detail']}" for c in conflicts)
+        return False, pd.DataFrame(), pd.DataFrame(), message, None
@@ -0,0 +1,95 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+from shift_solver import DEFAULT_PARAMS, normalize_event_units
+
+# 求解結果のキャッシュ
+# 入力（職員一覧・希望休一覧・対象年月・イベント単位数・各ルールのON/OFFとペナルティ）の指紋をキーにして結果を保存する。
+# 完全一致すれば保存済みの勤務表をそのまま返す。ただし最適性が証明されていない解は、保存時より長い制限時間か小さい
+# 許容ギャップを指定された場合（「現在の解で確定する」で止めた解は、止めた時点までの時間で求めたものとみなす）は返さず、
+# 次の求解のヒントにだけ使う。
+# 同じ年月の近い入力があれば、その shifts の値をヒントとして次の求解に渡す。
+
+def _digest(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+def input_fingerprint_parts(params):
+    settings = {key: params.get(key, default) for key, default in DEFAULT_PARAMS.items()}
+    return {
+        'staff': _digest(params['staff_df'].to_csv(index=False)),
+        'requests': _digest(params['requests_df'].to_csv(index=False)),
+        'events': _digest(json.dumps(normalize_event_units(params.get('event_units')), sort_keys=True, default=str)),
+        'settings': _digest(json.dumps(settings, sort_keys=True, default=str)),
+    }
+
+def input_fingerprint(params):
+    parts = input_fingerprint_parts(params)
+    return _digest(json.dumps([params['year'], params['month'], parts], sort_keys=True))
+
+def _is_proven(report):
+    # 最適性（または解がないこと）が証明済みか。許容ギャップで打ち切った場合も OPTIMAL になるため、目的関数値と下界の一致まで確かめる
+    if not report: return False
+    solver = report['solver']
+    return solver['status'] == 'INFEASIBLE' or (solver['status'] == 'OPTIMAL' and solver['objective'] == solver['best_bound'])
+
+def _solve_limits(params):
+    return float(params.get('time_limit', 60.0)), float(params.get('relative_gap_limit') or 0.0)
+
+def _covers(entry, params):
+    # 保存済みの解が、今回の制限時間・許容ギャップで解いた場合と同等以上に探索したものかどうか
+    if _is_proven(entry['report']): return True
+    if entry['time_limit'] is None: return False
+    time_limit, gap_limit = _solve_limits(params)
+    return time_limit <= entry['time_limit'] and gap_limit >= entry['gap_limit']
+
+class SolveCache:
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, params):
+        key = input_fingerprint(params)
+        if key not in self._entries or not _covers(self._entries[key], params): return None
+        self._entries.move_to_end(key)
+        if self._entries[key]['report'] is not None: params['solve_report'] = self._entries[key]['report']
+        return self._entries[key]['result']
+
+    def hint_values(self, params):
+        # 同じ年月のエントリのうち、一致する入力要素が最も多く、より新しいものの shifts を返す
+        parts = input_fingerprint_parts(params)
+        staff = set(params['staff_df']['職員番号'])
+        best, best_score = None, -1
+        for entry in self._entries.values():
+            if (entry['year'], entry['month']) != (params['year'], params['month']) or not entry['shifts_values']: continue
+            score = sum(entry['parts'][k] == v for k, v in parts.items())
+            if score >= best_score: best, best_score = entry, score
+        if best is None: return None
+        return {(s, d): v for (s, d), v in best['shifts_values'].items() if s in staff}
+
+    def put(self, params, result, shifts_values=None, report=None):
+        key = input_fingerprint(params)
+        time_limit, gap_limit = _solve_limits(params)
+        # 途中で止めた解は、実際に探索した時間を制限時間として記録する（制限時間いっぱいまで探索した場合の誤差は無視する）
+        if not report: time_limit = None
+        elif report['solver']['wall_time'] < 0.95 * time_limit: time_limit = report['solver']['wall_time']
+        self._entries[key] = {'year': params['year'], 'month': params['month'], 'parts': input_fingerprint_parts(params),
+                              'result': result, 'shifts_values': shifts_values, 'report': report, 'time_limit': time_limit, 'gap_limit': gap_limit}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+
+def _copy_result(result):
+    is_feasible, schedule_df, summary_df, message, all_half_day_requests = result
+    return is_feasible, schedule_df.copy(), summary_df.copy(), message, all_half_day_requests
+
+def cached_result(params, cache):
+    # 完全に同じ入力で、今回の制限時間でも変わらない結果が保存されていれば、その旨をメッセージに添えて返す（なければ None）
+    cached = cache.get(params)
+    if cached is None: return None
+    is_feasible, schedule_df, summary_df, message, all_half_day_requests = _copy_result(cached)
+    note = '前回と同じ入力のため、保存済みの結果を表示しています'
+    if not _is_proven(params.get('solve_report')): note += '。制限時間を延ばすと解き直します'
+    return is_feasible, schedule_df, summary_df, f"{message}（{note}）", all_half_day_requests
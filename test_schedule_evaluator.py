@@ -0,0 +1,65 @@
+import calendar
+
+import pandas as pd
+import pytest
+
+from benchmark import generate_params
+from shift_solver import solve_shift_model, _create_summary
+from schedule_evaluator import evaluate_schedule
+
+# ソルバーの結果と、ソルバーを使わない評価・集計の突き合わせ
+
+@pytest.fixture(scope='module')
+def solved():
+    params = generate_params(20, 2025, 5, density=0.1, seed=20, time_limit=10, num_workers=4)
+    is_feasible, schedule_df, summary_df, _, all_half_day_requests = solve_shift_model(params)
+    assert is_feasible
+    return params, schedule_df, summary_df, all_half_day_requests
+
+def _reference_summary(schedule_df, staff_info_dict, year, month, event_units, all_half_day_requests):
+    # 行列化する前の（職員ごとにループする）集計。出力が変わっていないことの基準にする
+    num_days = calendar.monthrange(year, month)[1]; daily_summary = []
+    work_symbols = ['', '○', '出', 'AM休', 'PM休', 'AM有', 'PM有']
+    for d in range(1, num_days + 1):
+        day_info = {}
+        work_staff_ids = schedule_df[schedule_df[d].isin(work_symbols)]['職員番号']
+        half_day_staff_ids = [s for s, dates in all_half_day_requests.items() if d in dates]
+        count = lambda pred: sum(0.5 if sid in half_day_staff_ids else 1 for sid in work_staff_ids if pred(staff_info_dict[sid]))
+        units = lambda job: sum(int(staff_info_dict[sid]['1日の単位数']) * (0.5 if sid in half_day_staff_ids else 1) for sid in work_staff_ids if staff_info_dict[sid]['職種'] == job)
+        day_info['日'] = d; day_info['曜日'] = ['月','火','水','木','金','土','日'][calendar.weekday(year, month, d)]
+        day_info['出勤者総数'] = count(lambda info: True)
+        day_info['PT'] = count(lambda info: info['職種'] == '理学療法士')
+        day_info['OT'] = count(lambda info: info['職種'] == '作業療法士')
+        day_info['ST'] = count(lambda info: info['職種'] == '言語聴覚士')
+        day_info['役職者'] = count(lambda info: pd.notna(info['役職']))
+        day_info['回復期'] = count(lambda info: info.get('役割1') == '回復期専従')
+        day_info['地域包括'] = count(lambda info: info.get('役割1') == '地域包括専従')
+        day_info['外来'] = count(lambda info: info.get('役割1') == '外来PT')
+        if calendar.weekday(year, month, d) != 6:
+            pt_units, ot_units, st_units = units('理学療法士'), units('作業療法士'), units('言語聴覚士')
+            day_info['PT単位数'] = pt_units; day_info['OT単位数'] = ot_units; day_info['ST単位数'] = st_units
+            day_info['PT+OT単位数'] = pt_units + ot_units
+            day_info['特別業務単位数'] = event_units['all'].get(d, 0) + event_units['pt'].get(d, 0) + event_units['ot'].get(d, 0) + event_units['st'].get(d, 0)
+        else:
+            day_info['PT単位数'] = '-'; day_info['OT単位数'] = '-'; day_info['ST単位数'] = '-'
+            day_info['PT+OT単位数'] = '-'; day_info['特別業務単位数'] = '-'
+        daily_summary.append(day_info)
+    return pd.DataFrame(daily_summary)
+
+def test_evaluator_matches_solve_report(solved):
+    params, schedule_df, _, _ = solved
+    evaluation = evaluate_schedule(schedule_df, params)
+    report = {f['family']: (f['penalty'], f['violations']) for f in params['solve_report']['families'] if f['penalty'] is not None}
+    evaluated = {row.family: (row.penalty, row.violations) for row in evaluation['families'].itertuples()}
+    assert evaluation['feasible']
+    assert evaluated == report
+    assert evaluation['objective'] == round(params['solve_report']['solver']['objective'])
+
+def test_summary_matches_reference(solved):
+    params, schedule_df, summary_df, all_half_day_requests = solved
+    # 半日勤務を含む日がなければ、この比較は半日の扱いを確かめられない
+    work = schedule_df.set_index('職員番号')
+    assert any(work.loc[s, d] in ('AM休', 'PM休', 'AM有', 'PM有') for s, dates in all_half_day_requests.items() for d in dates)
+    expected = _reference_summary(schedule_df, params['staff_info'], params['year'], params['month'], params['event_units'], all_half_day_requests)
+    pd.testing.assert_frame_equal(summary_df, expected)
+    pd.testing.assert_frame_equal(_create_summary(schedule_df.copy(), params['staff_info'], params['year'], params['month'], params['event_units'], all_half_day_requests), expected)